@@ -0,0 +1,123 @@
+import asyncio
+import secrets
+from datetime import datetime, timezone
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
+
+from app import schemas
+from app.config import AppConfig
+from app.dead_letters import DEFAULT_REPLAY_BATCH_SIZE, replay_dead_letters
+from app.enums import DeadLetterReason
+from app.monitoring import sample_profile
+
+MAX_PROFILE_SECONDS = 60.0
+MAX_DEAD_LETTER_PAGE = 1000
+MAX_REPLAY_BATCH_SIZE = 1000
+
+# one profile at a time, each sampler is a busy thread
+profile_lock = asyncio.Lock()
+
+
+def require_admin(
+    request: Request, admin_key: Annotated[str, Header(alias="X-Admin-Key")] = ""
+):
+    cfg: AppConfig = request.app.state.cfg
+    if not cfg.ADMIN_API_KEY:
+        raise HTTPException(status_code=404, detail="Admin API disabled")
+    if not secrets.compare_digest(admin_key.encode(), cfg.ADMIN_API_KEY.encode()):
+        raise HTTPException(status_code=401, detail="Bad admin key")
+
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+
+@router.get("/loop-lag", response_model=schemas.LoopLagReport)
+async def loop_lag(request: Request):
+    monitor = request.app.state.loop_monitor
+    if monitor is None:
+        raise HTTPException(status_code=404, detail="Loop lag monitor disabled")
+    return monitor.report()
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: Annotated[float, Query(gt=0, le=MAX_PROFILE_SECONDS)] = 5.0,
+):
+    """Samples all threads for seconds, returns flamegraph-ready collapsed stacks"""
+    if profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    async with profile_lock:
+        return await asyncio.to_thread(sample_profile, seconds)
+
+
+@router.get("/queue-stats", response_model=schemas.QueueStats | None)
+async def queue_stats(request: Request):
+    """Report from the latest queue maintenance pass"""
+    return request.app.state.queue_stats
+
+
+def dead_letter_filter(
+    since: datetime | None = None,
+    until: datetime | None = None,
+    reason: DeadLetterReason | None = None,
+    status_code: int | None = None,
+) -> schemas.DeadLetterFilter:
+    return schemas.DeadLetterFilter(
+        since=since, until=until, reason=reason, status_code=status_code
+    )
+
+
+@router.get("/dead-letters", response_model=schemas.DeadLetterPage)
+async def dead_letters(
+    request: Request,
+    where: Annotated[schemas.DeadLetterFilter, Depends(dead_letter_filter)],
+    limit: Annotated[int, Query(gt=0, le=MAX_DEAD_LETTER_PAGE)] = 100,
+):
+    """Tasks which ran out of retries, oldest first. Page on with since"""
+    store = request.app.state.dead_letters
+    return schemas.DeadLetterPage(
+        total=await store.run(store.count, where),
+        items=await store.run(store.find, where, limit),
+    )
+
+
+@router.post(
+    "/dead-letters/replay", status_code=202, response_model=schemas.ReplayProgress
+)
+async def replay(
+    request: Request,
+    where: Annotated[schemas.DeadLetterFilter, Depends(dead_letter_filter)],
+    batch_size: Annotated[
+        int, Query(gt=0, le=MAX_REPLAY_BATCH_SIZE)
+    ] = DEFAULT_REPLAY_BATCH_SIZE,
+):
+    """Moves matching dead letters back onto the queue in the background
+
+    Paced to the upstream rate limit, poll GET for progress.
+    """
+    state = request.app.state
+    if state.replay_task is not None and not state.replay_task.done():
+        raise HTTPException(status_code=409, detail="A replay is already running")
+    state.replay_progress = schemas.ReplayProgress(
+        matched=await state.dead_letters.run(state.dead_letters.count, where),
+        started_at=datetime.now(timezone.utc),
+    )
+    state.replay_task = asyncio.create_task(
+        replay_dead_letters(
+            state.dead_letters,
+            state.queue,
+            where,
+            state.replay_progress,
+            batch_size=batch_size,
+            pace=state.manager.time_step,
+        )
+    )
+    return state.replay_progress
+
+
+@router.get("/dead-letters/replay", response_model=schemas.ReplayProgress | None)
+async def replay_progress(request: Request):
+    """Progress of the latest replay"""
+    return request.app.state.replay_progress
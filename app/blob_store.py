@@ -0,0 +1,138 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from abc import ABC
+
+from app.blocking import BlockingStore
+from app.config import AppConfig
+
+
+def blob_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class AbstractBlobStore(BlockingStore, ABC):
+    """Content addressed store for large messages, keyed by sha256 hex digest
+
+    Blobs are reference counted, identical payloads are stored once. Every
+    put() must be paired with a release() once the referencing task is done.
+    """
+
+    def put(self, data: bytes) -> str:
+        """Stores data, or adds a reference if already stored, returns its digest"""
+        pass
+
+    def get(self, digest: str) -> bytes | None:
+        pass
+
+    def release(self, digest: str) -> None:
+        """Drops a reference, the blob is deleted with its last one"""
+        pass
+
+
+class InMemoryBlobStore(AbstractBlobStore):
+
+    def __init__(self):
+        self.blobs: dict[str, tuple[bytes, int]] = {}
+
+    def put(self, data: bytes) -> str:
+        digest = blob_digest(data)
+        _, refs = self.blobs.get(digest, (data, 0))
+        self.blobs[digest] = (data, refs + 1)
+        return digest
+
+    def get(self, digest: str) -> bytes | None:
+        entry = self.blobs.get(digest)
+        return entry[0] if entry is not None else None
+
+    def release(self, digest: str) -> None:
+        entry = self.blobs.get(digest)
+        if entry is None:
+            return
+        data, refs = entry
+        if refs > 1:
+            self.blobs[digest] = (data, refs - 1)
+        else:
+            del self.blobs[digest]
+
+
+class SQLiteBlobStore(AbstractBlobStore):
+    """Blobs live alongside the persistent queue so they survive restarts
+
+    Each put is up to a MiB written and committed, too long to hold up the
+    event loop, so calls run in worker threads sharing one connection.
+    """
+
+    DB_FILE_NAME = "blobs.db"
+    in_thread = True
+
+    def __init__(self, db_path: str):
+        os.makedirs(db_path, exist_ok=True)
+        self.conn = sqlite3.connect(
+            os.path.join(db_path, self.DB_FILE_NAME), check_same_thread=False
+        )
+        # one transaction on the connection at a time
+        self.lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                "digest TEXT PRIMARY KEY, data BLOB NOT NULL, refs INTEGER NOT NULL)"
+            )
+
+    def put(self, data: bytes) -> str:
+        digest = blob_digest(data)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO blobs (digest, data, refs) VALUES (?, ?, 1) "
+                "ON CONFLICT (digest) DO UPDATE SET refs = refs + 1",
+                (digest, data),
+            )
+        return digest
+
+    def get(self, digest: str) -> bytes | None:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT data FROM blobs WHERE digest = ?", (digest,)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def release(self, digest: str) -> None:
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE blobs SET refs = refs - 1 WHERE digest = ?", (digest,)
+            )
+            self.conn.execute(
+                "DELETE FROM blobs WHERE digest = ? AND refs <= 0", (digest,)
+            )
+
+
+class TieredBlobStore(SQLiteBlobStore):
+    """Large messages of the tiered queue, on disk rather than in memory
+
+    The tiered queue starts empty, so the blobs of its lost tasks are
+    deleted on startup, like its segment files.
+    """
+
+    DB_FILE_NAME = "tiered_blobs.db"
+
+    def __init__(self, db_path: str):
+        db_file = os.path.join(db_path, self.DB_FILE_NAME)
+        for path in (db_file, f"{db_file}-wal", f"{db_file}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+        super().__init__(db_path)
+
+
+def blob_store_factory(cfg: AppConfig) -> AbstractBlobStore:
+    if cfg.QUEUE_TYPE in ("persistent", "sharded"):
+        return SQLiteBlobStore(cfg.PERSISTENT_QUEUE_PATH)
+    elif cfg.QUEUE_TYPE == "postgres":
+        from app.postgres_blob_store import PostgresBlobStore
+
+        return PostgresBlobStore(cfg.DATABASE_URL)
+    elif cfg.QUEUE_TYPE == "tiered":
+        return TieredBlobStore(cfg.PERSISTENT_QUEUE_PATH)
+    else:
+        return InMemoryBlobStore()
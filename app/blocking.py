@@ -0,0 +1,22 @@
+import asyncio
+from collections.abc import Callable
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+
+class BlockingStore:
+    """Base of the queue and the stores, whose methods are blocking io
+
+    Calls from the event loop go through run(). Local backends are called
+    inline, a thread hop would cost more than the call. Backends on a
+    networked database, or writing large rows, set in_thread, their calls run
+    in a worker thread so their latency only holds up the request awaiting it.
+    """
+
+    in_thread = False
+
+    async def run(self, fn: Callable[..., T], /, *args: Any) -> T:
+        if self.in_thread:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
@@ -7,16 +7,120 @@ class AppConfig(BaseModel):
     API_KEY: str = Field(description="Unreliable service API key")
     UNRELIABLE_SERVICE_URL: str = Field(description="Unreliable service URL")
     LOG_LEVEL: Literal["INFO", "DEBUG", "WARNING", "ERROR"]
-    QUEUE_TYPE: Literal["persistent", "in_memory"] = Field(default="persistent")
+    LOG_FORMAT: Literal["text", "json"] = Field(default="text")
+    LOG_THROTTLE_SECONDS: float = Field(
+        default=10.0,
+        description="Minimum interval between repeats of a throttled log message",
+    )
+    QUEUE_TYPE: Literal["persistent", "in_memory", "postgres", "tiered", "sharded"] = (
+        Field(default="persistent")
+    )
     PERSISTENT_QUEUE_PATH: str = Field(
         default="", description="Path for persistent storage"
     )
+    SQLITE_SYNCHRONOUS: Literal["OFF", "NORMAL", "FULL"] = Field(
+        default="NORMAL", description="synchronous level of the SQLite queue"
+    )
+    QUEUE_MAINTENANCE_INTERVAL_SECONDS: float = Field(
+        default=15 * 60,
+        description="Seconds between queue compactions, 0 disables them",
+    )
+    QUEUE_MAINTENANCE_BATCH_SIZE: int = Field(
+        default=1000, description="Rows deleted per transaction when compacting"
+    )
+    PERSISTENT_QUEUE_SHARDS: int = Field(
+        default=4, description="Number of SQLite files for QUEUE_TYPE=sharded"
+    )
+    TIERED_QUEUE_MAX_MEMORY_BYTES: int = Field(
+        default=64 * 1024 * 1024,
+        description="Memory held by the tiered queue before it spills to disk",
+    )
+    TIERED_QUEUE_SEGMENT_TASKS: int = Field(
+        default=10_000,
+        description="Tasks per tiered queue spill file, each is deleted once paged in",
+    )
+    DATABASE_URL: str = Field(
+        default="", description="SQLAlchemy URL of the postgres queue database"
+    )
+    QUEUE_LEASE_SECONDS: float = Field(
+        default=60.0,
+        description="How long a dequeued task is hidden from other consumers",
+    )
+    IDEMPOTENCY_TTL_SECONDS: float = Field(
+        default=24 * 60 * 60,
+        description="How long an Idempotency-Key maps to the task it created",
+    )
+    ADMIN_API_KEY: str = Field(
+        default="", description="Key for the /admin endpoints, unset disables them"
+    )
+    LOOP_LAG_INTERVAL_SECONDS: float = Field(
+        default=0.1, description="Event loop lag sampling interval, 0 disables it"
+    )
+    LOOP_LAG_STALL_SECONDS: float = Field(
+        default=0.1,
+        description="Capture the loop's stack when blocked for longer than this",
+    )
     MAX_TASK_RETRIES: int = Field(
         default=5, description="Maximum number of tries before failing the task."
     )
+    UPSTREAM_HTTP2: bool = Field(
+        default=True, description="Multiplex upstream requests over HTTP/2"
+    )
+    UPSTREAM_MAX_CONNECTIONS: int = Field(default=20)
+    UPSTREAM_MAX_KEEPALIVE_CONNECTIONS: int = Field(default=10)
+    UPSTREAM_KEEPALIVE_EXPIRY: float = Field(
+        default=30.0, description="Seconds an idle upstream connection is kept open"
+    )
+    UPSTREAM_CONNECT_TIMEOUT: float = Field(default=3.0)
+    UPSTREAM_READ_TIMEOUT: float = Field(
+        default=10.0,
+        description="Seconds to wait on an upstream response before the call fails",
+    )
+    UPSTREAM_WARM_UP: bool = Field(
+        default=True, description="Open an upstream connection on startup"
+    )
+    WEBHOOK_TIMEOUT: float = Field(default=1.0)
+    UPSTREAM_MAX_REQUESTS_PER_MINUTE: int = Field(
+        default=10, description="Rate budget for calls to the unreliable service"
+    )
+    UPSTREAM_MAX_IN_FLIGHT: int = Field(
+        default=3,
+        description="Maximum number of unreliable service calls awaiting a response",
+    )
+    SIGN_MAX_MESSAGE_BYTES: int = Field(
+        default=1024 * 1024,
+        description="Largest message POST /crypto/sign accepts, after decompression",
+    )
+    BLOB_THRESHOLD_BYTES: int = Field(
+        default=1024,
+        description="Queued messages larger than this are stored once in the blob "
+        "store and referenced by hash",
+    )
+    SHUTDOWN_DRAIN_SECONDS: float = Field(
+        default=5.0,
+        description="How long shutdown waits for in flight tasks and their webhooks",
+    )
 
     @model_validator(mode="after")
     def if_persistent_queue_a_path_is_required(self) -> Self:
         if self.QUEUE_TYPE == "persistent" and not self.PERSISTENT_QUEUE_PATH:
             raise ValueError("PERSISTENT_QUEUE_PATH required for QUEUE_TYPE=persistent")
         return self
+
+    @model_validator(mode="after")
+    def if_sharded_queue_a_path_is_required(self) -> Self:
+        if self.QUEUE_TYPE == "sharded" and not self.PERSISTENT_QUEUE_PATH:
+            raise ValueError("PERSISTENT_QUEUE_PATH required for QUEUE_TYPE=sharded")
+        return self
+
+    @model_validator(mode="after")
+    def if_tiered_queue_a_path_is_required(self) -> Self:
+        if self.QUEUE_TYPE == "tiered" and not self.PERSISTENT_QUEUE_PATH:
+            raise ValueError("PERSISTENT_QUEUE_PATH required for QUEUE_TYPE=tiered")
+        return self
+
+    @model_validator(mode="after")
+    def if_postgres_queue_a_database_url_is_required(self) -> Self:
+        if self.QUEUE_TYPE == "postgres" and not self.DATABASE_URL:
+            raise ValueError("DATABASE_URL required for QUEUE_TYPE=postgres")
+        return self
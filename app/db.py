@@ -0,0 +1,63 @@
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+metadata = sa.MetaData()
+
+sign_tasks = sa.Table(
+    "sign_tasks",
+    metadata,
+    sa.Column("id", sa.Uuid(), primary_key=True),
+    # insertion order, breaks ties between tasks with the same ready_at
+    sa.Column("seq", sa.BigInteger(), sa.Identity(), nullable=False),
+    sa.Column("status", sa.String(16), nullable=False),
+    sa.Column("payload", postgresql.JSONB(), nullable=False),
+    sa.Column(
+        "ready_at",
+        sa.DateTime(timezone=True),
+        nullable=False,
+        server_default=sa.func.now(),
+    ),
+    sa.Column("leased_until", sa.DateTime(timezone=True), nullable=True),
+    sa.Index(
+        "ix_sign_tasks_pending_ready_at",
+        "ready_at",
+        "seq",
+        postgresql_where=sa.text("status = 'PENDING'"),
+    ),
+)
+
+idempotency_keys = sa.Table(
+    "idempotency_keys",
+    metadata,
+    sa.Column("key", sa.Text(), primary_key=True),
+    sa.Column("task", postgresql.JSONB(), nullable=False),
+    sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+    sa.Index("ix_idempotency_keys_expires_at", "expires_at"),
+)
+
+dead_letters = sa.Table(
+    "dead_letters",
+    metadata,
+    sa.Column("task_id", sa.Uuid(), primary_key=True),
+    sa.Column("task", postgresql.JSONB(), nullable=False),
+    sa.Column("reason", sa.String(32), nullable=False),
+    sa.Column("last_status_code", sa.Integer(), nullable=True),
+    sa.Column("first_failed_at", sa.DateTime(timezone=True), nullable=False),
+    sa.Column("last_failed_at", sa.DateTime(timezone=True), nullable=False),
+    sa.Column("failures", sa.Integer(), nullable=False),
+    sa.Index("ix_dead_letters_last_failed_at", "last_failed_at"),
+    sa.Index("ix_dead_letters_reason", "reason", "last_failed_at"),
+    sa.Index("ix_dead_letters_last_status_code", "last_status_code", "last_failed_at"),
+)
+
+message_blobs = sa.Table(
+    "message_blobs",
+    metadata,
+    sa.Column("digest", sa.String(64), primary_key=True),
+    sa.Column("data", sa.LargeBinary(), nullable=False),
+    sa.Column("refs", sa.Integer(), nullable=False),
+)
+
+
+def create_db_engine(url: str, **kwargs) -> sa.Engine:
+    return sa.create_engine(url, pool_pre_ping=True, **kwargs)
@@ -0,0 +1,261 @@
+import asyncio
+import os
+import sqlite3
+from abc import ABC
+from collections.abc import Iterable
+from datetime import datetime, timezone
+from uuid import UUID
+
+from app.blocking import BlockingStore
+from app.config import AppConfig
+from app.enums import DeadLetterReason
+from app.logging import get_logger
+from app.queue import AbstractQueue
+from app.schemas import DeadLetter, DeadLetterFilter, IntSignTask, ReplayProgress
+
+logger = get_logger(__name__)
+
+DEFAULT_REPLAY_BATCH_SIZE = 100
+
+
+class AbstractDeadLetterStore(BlockingStore, ABC):
+    """Tasks which ran out of retries, keyed by task id
+
+    Adding a task already in the store, eg. one which failed again after
+    a replay, keeps first_failed_at and counts the failure.
+    """
+
+    def add(
+        self,
+        task: IntSignTask,
+        reason: DeadLetterReason,
+        last_status_code: int | None = None,
+    ) -> None:
+        pass
+
+    def find(self, where: DeadLetterFilter, limit: int = 100) -> list[DeadLetter]:
+        """Matching dead letters, oldest last_failed_at first"""
+        pass
+
+    def count(self, where: DeadLetterFilter) -> int:
+        pass
+
+    def delete(self, task_ids: Iterable[UUID]) -> int:
+        """Removes all of task_ids in one transaction, returns the number removed"""
+        pass
+
+
+def matches(letter: DeadLetter, where: DeadLetterFilter) -> bool:
+    return (
+        (where.since is None or letter.last_failed_at >= where.since)
+        and (where.until is None or letter.last_failed_at < where.until)
+        and (where.reason is None or letter.reason == where.reason)
+        and (where.status_code is None or letter.last_status_code == where.status_code)
+    )
+
+
+class InMemoryDeadLetterStore(AbstractDeadLetterStore):
+    """Lost on restart, like the in memory queue it sits beside"""
+
+    def __init__(self):
+        self.letters: dict[UUID, DeadLetter] = {}
+
+    def add(
+        self,
+        task: IntSignTask,
+        reason: DeadLetterReason,
+        last_status_code: int | None = None,
+    ) -> None:
+        now = datetime.now(timezone.utc)
+        existing = self.letters.pop(task.id, None)
+        # re-inserted so the dict stays in last_failed_at order
+        self.letters[task.id] = DeadLetter(
+            task=task,
+            reason=reason,
+            last_status_code=last_status_code,
+            first_failed_at=existing.first_failed_at if existing else now,
+            last_failed_at=now,
+            failures=existing.failures + 1 if existing else 1,
+        )
+
+    def find(self, where: DeadLetterFilter, limit: int = 100) -> list[DeadLetter]:
+        found = []
+        for letter in self.letters.values():
+            if len(found) == limit:
+                break
+            if matches(letter, where):
+                found.append(letter)
+        return found
+
+    def count(self, where: DeadLetterFilter) -> int:
+        return sum(1 for letter in self.letters.values() if matches(letter, where))
+
+    def delete(self, task_ids: Iterable[UUID]) -> int:
+        return sum(self.letters.pop(task_id, None) is not None for task_id in task_ids)
+
+
+class SQLiteDeadLetterStore(AbstractDeadLetterStore):
+    """Dead letters live alongside the persistent queue so they survive restarts
+
+    Times are stored as unix seconds. Every filter is served by an index
+    ending in last_failed_at, so results come back in order without a sort.
+    """
+
+    DB_FILE_NAME = "dead_letters.db"
+
+    def __init__(self, db_path: str):
+        os.makedirs(db_path, exist_ok=True)
+        # opened in a worker thread on startup, then only used from the event loop
+        self.conn = sqlite3.connect(
+            os.path.join(db_path, self.DB_FILE_NAME), check_same_thread=False
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS dead_letters ("
+                "task_id TEXT PRIMARY KEY, task TEXT NOT NULL, reason TEXT NOT NULL, "
+                "last_status_code INTEGER, first_failed_at REAL NOT NULL, "
+                "last_failed_at REAL NOT NULL, failures INTEGER NOT NULL)"
+            )
+            for name, columns in (
+                ("ix_dead_letters_last_failed_at", "last_failed_at"),
+                ("ix_dead_letters_reason", "reason, last_failed_at"),
+                (
+                    "ix_dead_letters_last_status_code",
+                    "last_status_code, last_failed_at",
+                ),
+            ):
+                self.conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {name} ON dead_letters ({columns})"
+                )
+
+    @staticmethod
+    def _where(where: DeadLetterFilter) -> tuple[str, list]:
+        clauses, params = ["1 = 1"], []
+        if where.since is not None:
+            clauses.append("last_failed_at >= ?")
+            params.append(where.since.timestamp())
+        if where.until is not None:
+            clauses.append("last_failed_at < ?")
+            params.append(where.until.timestamp())
+        if where.reason is not None:
+            clauses.append("reason = ?")
+            params.append(where.reason.value)
+        if where.status_code is not None:
+            clauses.append("last_status_code = ?")
+            params.append(where.status_code)
+        return " AND ".join(clauses), params
+
+    @staticmethod
+    def _letter(
+        task: str,
+        reason: str,
+        last_status_code: int | None,
+        first_failed_at: float,
+        last_failed_at: float,
+        failures: int,
+    ) -> DeadLetter:
+        return DeadLetter(
+            task=IntSignTask.model_validate_json(task),
+            reason=DeadLetterReason(reason),
+            last_status_code=last_status_code,
+            first_failed_at=datetime.fromtimestamp(first_failed_at, timezone.utc),
+            last_failed_at=datetime.fromtimestamp(last_failed_at, timezone.utc),
+            failures=failures,
+        )
+
+    def add(
+        self,
+        task: IntSignTask,
+        reason: DeadLetterReason,
+        last_status_code: int | None = None,
+    ) -> None:
+        now = datetime.now(timezone.utc).timestamp()
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO dead_letters (task_id, task, reason, last_status_code, "
+                "first_failed_at, last_failed_at, failures) "
+                "VALUES (?, ?, ?, ?, ?, ?, 1) "
+                "ON CONFLICT (task_id) DO UPDATE SET task = excluded.task, "
+                "reason = excluded.reason, "
+                "last_status_code = excluded.last_status_code, "
+                "last_failed_at = excluded.last_failed_at, failures = failures + 1",
+                (
+                    str(task.id),
+                    task.model_dump_json(),
+                    reason.value,
+                    last_status_code,
+                    now,
+                    now,
+                ),
+            )
+
+    def find(self, where: DeadLetterFilter, limit: int = 100) -> list[DeadLetter]:
+        clause, params = self._where(where)
+        rows = self.conn.execute(
+            "SELECT task, reason, last_status_code, first_failed_at, "
+            f"last_failed_at, failures FROM dead_letters WHERE {clause} "
+            "ORDER BY last_failed_at LIMIT ?",
+            (*params, limit),
+        )
+        return [self._letter(*row) for row in rows]
+
+    def count(self, where: DeadLetterFilter) -> int:
+        clause, params = self._where(where)
+        return self.conn.execute(
+            f"SELECT COUNT(*) FROM dead_letters WHERE {clause}", params
+        ).fetchone()[0]
+
+    def delete(self, task_ids: Iterable[UUID]) -> int:
+        with self.conn:
+            return self.conn.executemany(
+                "DELETE FROM dead_letters WHERE task_id = ?",
+                ((str(task_id),) for task_id in task_ids),
+            ).rowcount
+
+
+async def replay_dead_letters(
+    store: AbstractDeadLetterStore,
+    queue: AbstractQueue,
+    where: DeadLetterFilter,
+    progress: ReplayProgress,
+    batch_size: int = DEFAULT_REPLAY_BATCH_SIZE,
+    pace: float = 0.0,
+):
+    """Moves matching dead letters back onto the queue, batch_size at a time
+
+    Each batch is queued with one add_many and then removed from the store in
+    one transaction, a crash in between replays the batch twice rather than
+    losing it. After each batch it sleeps pace seconds per task, set to the
+    upstream's time step the queue is refilled no faster than it drains.
+    """
+    # tasks which fail again during the replay aren't picked up a second time
+    if where.until is None or where.until > progress.started_at:
+        where = where.model_copy(update={"until": progress.started_at})
+    try:
+        while letters := await store.run(store.find, where, batch_size):
+            tasks = [letter.task for letter in letters]
+            for task in tasks:
+                task.reset()
+            await queue.run(queue.add_many, tasks)
+            await store.run(store.delete, [task.id for task in tasks])
+            progress.replayed += len(tasks)
+            logger.info("Replayed %d dead letters", progress.replayed)
+            await asyncio.sleep(len(tasks) * pace)
+    except Exception:
+        # runs in the background, nobody awaits it to see the error
+        logger.exception("Replay of dead letters failed")
+    finally:
+        progress.running = False
+        progress.finished_at = datetime.now(timezone.utc)
+
+
+def dead_letter_store_factory(cfg: AppConfig) -> AbstractDeadLetterStore:
+    if cfg.QUEUE_TYPE in ("persistent", "sharded"):
+        return SQLiteDeadLetterStore(cfg.PERSISTENT_QUEUE_PATH)
+    elif cfg.QUEUE_TYPE == "postgres":
+        from app.postgres_dead_letters import PostgresDeadLetterStore
+
+        return PostgresDeadLetterStore(cfg.DATABASE_URL)
+    else:
+        return InMemoryDeadLetterStore()
@@ -17,3 +17,10 @@ class SignTaskStatus(Enum):
     PENDING = "PENDING"
     # number of message sign attempts has gone over the retry limit
     FAIL = "FAIL"
+
+
+class DeadLetterReason(Enum):
+    # the upstream kept answering with an error status until retries ran out
+    MAX_RETRIES = "MAX_RETRIES"
+    # the blob holding the message was gone, it can never be signed
+    MISSING_MESSAGE = "MISSING_MESSAGE"
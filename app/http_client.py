@@ -0,0 +1,91 @@
+import importlib.util
+
+import httpx
+
+from app.config import AppConfig
+from app.logging import get_logger
+
+logger = get_logger(__name__)
+
+
+def get_unreliable_service_headers(cfg: AppConfig):
+    return {"Authorization": cfg.API_KEY}
+
+
+def http2_available() -> bool:
+    # httpx only supports HTTP/2 with the optional h2 package installed
+    return importlib.util.find_spec("h2") is not None
+
+
+def build_upstream_client(
+    cfg: AppConfig, transport: httpx.AsyncBaseTransport | None = None
+) -> httpx.AsyncClient:
+    http2 = cfg.UPSTREAM_HTTP2
+    if http2 and not http2_available():
+        logger.warning("UPSTREAM_HTTP2 set but h2 is not installed, using HTTP/1.1")
+        http2 = False
+    return httpx.AsyncClient(
+        headers=get_unreliable_service_headers(cfg),
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=cfg.UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=cfg.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=cfg.UPSTREAM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            cfg.UPSTREAM_READ_TIMEOUT,
+            connect=cfg.UPSTREAM_CONNECT_TIMEOUT,
+            pool=cfg.UPSTREAM_CONNECT_TIMEOUT,
+        ),
+        transport=transport,
+    )
+
+
+def build_webhook_client(
+    cfg: AppConfig, transport: httpx.AsyncBaseTransport | None = None
+) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=cfg.WEBHOOK_TIMEOUT,
+        limits=httpx.Limits(max_connections=cfg.UPSTREAM_MAX_CONNECTIONS),
+        transport=transport,
+    )
+
+
+class HttpClients:
+    """Registry of the shared http clients, one set per app lifespan
+
+    upstream: authenticated client for the unreliable service
+    webhook: client used to deliver results to user webhooks
+    """
+
+    def __init__(
+        self, cfg: AppConfig, transport: httpx.AsyncBaseTransport | None = None
+    ):
+        self.cfg = cfg
+        self.upstream = build_upstream_client(cfg, transport=transport)
+        self.webhook = build_webhook_client(cfg, transport=transport)
+
+    async def warm_up(self) -> bool:
+        """Opens a pooled connection to the upstream ahead of the first sign
+
+        Pays for DNS, TCP and TLS up front. Failure is not fatal,
+        the connection will just be opened on first use instead.
+        """
+        try:
+            resp = await self.upstream.head(self.cfg.UNRELIABLE_SERVICE_URL)
+        except httpx.HTTPError:
+            logger.warning(
+                "Warm up of %s failed", self.cfg.UNRELIABLE_SERVICE_URL, exc_info=True
+            )
+            return False
+        logger.debug(
+            "Warmed up %s status=%d http_version=%s",
+            self.cfg.UNRELIABLE_SERVICE_URL,
+            resp.status_code,
+            resp.http_version,
+        )
+        return True
+
+    async def aclose(self):
+        await self.upstream.aclose()
+        await self.webhook.aclose()
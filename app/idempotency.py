@@ -0,0 +1,166 @@
+import os
+import sqlite3
+import time
+from abc import ABC
+from collections import OrderedDict
+
+from app.blocking import BlockingStore
+from app.config import AppConfig
+from app.schemas import IntSignTask
+
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+
+class AbstractIdempotencyIndex(BlockingStore, ABC):
+    """Maps an Idempotency-Key to the task it created
+
+    Keys expire ttl seconds after they are first seen. Updating the task
+    stored against a key, eg. once it is signed, doesn't extend its life.
+    """
+
+    def get(self, key: str) -> IntSignTask | None:
+        pass
+
+    def claim(self, key: str, task: IntSignTask) -> IntSignTask | None:
+        """Stores task against key unless a live task is already stored
+
+        Atomic, so of concurrent requests with the same key only one claims
+        it. Returns the task already stored, or None once key is claimed.
+        """
+        pass
+
+    def put(self, key: str, task: IntSignTask) -> None:
+        pass
+
+    def delete(self, key: str) -> None:
+        pass
+
+
+class InMemoryIdempotencyIndex(AbstractIdempotencyIndex):
+
+    def __init__(self, ttl: float = DEFAULT_TTL_SECONDS):
+        self.ttl = ttl
+        # all keys share one ttl, so insertion order is also expiry order
+        self.index: OrderedDict[str, tuple[float, IntSignTask]] = OrderedDict()
+
+    def _purge_expired(self, now: float) -> None:
+        while self.index:
+            key, (expires_at, _) = next(iter(self.index.items()))
+            if expires_at > now:
+                break
+            del self.index[key]
+
+    def get(self, key: str) -> IntSignTask | None:
+        entry = self.index.get(key)
+        if entry is None or entry[0] <= time.time():
+            return None
+        return entry[1]
+
+    def claim(self, key: str, task: IntSignTask) -> IntSignTask | None:
+        existing = self.get(key)
+        if existing is not None:
+            return existing
+        # an expired key starts a new ttl
+        self.index.pop(key, None)
+        self.put(key, task)
+        return None
+
+    def put(self, key: str, task: IntSignTask) -> None:
+        now = time.time()
+        self._purge_expired(now)
+        if key in self.index:
+            self.index[key] = (self.index[key][0], task)
+        else:
+            self.index[key] = (now + self.ttl, task)
+
+    def delete(self, key: str) -> None:
+        self.index.pop(key, None)
+
+
+class SQLiteIdempotencyIndex(AbstractIdempotencyIndex):
+    """Keys live alongside the persistent queue so they survive restarts"""
+
+    DB_FILE_NAME = "idempotency.db"
+    # number of puts between sweeps of expired keys
+    PURGE_EVERY = 1000
+
+    def __init__(self, db_path: str, ttl: float = DEFAULT_TTL_SECONDS):
+        self.ttl = ttl
+        os.makedirs(db_path, exist_ok=True)
+        # opened in a worker thread on startup, then only used from the event loop
+        self.conn = sqlite3.connect(
+            os.path.join(db_path, self.DB_FILE_NAME), check_same_thread=False
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS idempotency_keys ("
+                "key TEXT PRIMARY KEY, task TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_idempotency_keys_expires_at "
+                "ON idempotency_keys (expires_at)"
+            )
+        self._puts = 0
+
+    def get(self, key: str) -> IntSignTask | None:
+        row = self.conn.execute(
+            "SELECT task FROM idempotency_keys WHERE key = ? AND expires_at > ?",
+            (key, time.time()),
+        ).fetchone()
+        if row is None:
+            return None
+        return IntSignTask.model_validate_json(row[0])
+
+    def _count_put(self, now: float) -> None:
+        self._puts += 1
+        if self._puts % self.PURGE_EVERY == 0:
+            self.conn.execute(
+                "DELETE FROM idempotency_keys WHERE expires_at <= ?", (now,)
+            )
+
+    def claim(self, key: str, task: IntSignTask) -> IntSignTask | None:
+        now = time.time()
+        with self.conn:
+            claimed = self.conn.execute(
+                "INSERT INTO idempotency_keys (key, task, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET task = excluded.task, "
+                "expires_at = excluded.expires_at WHERE expires_at <= ?",
+                (key, task.model_dump_json(), now + self.ttl, now),
+            ).rowcount
+            if claimed:
+                self._count_put(now)
+                return None
+        return self.get(key)
+
+    def put(self, key: str, task: IntSignTask) -> None:
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO idempotency_keys (key, task, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET task = excluded.task, "
+                # an expired key which hasn't been swept yet is claimed afresh
+                "expires_at = CASE WHEN expires_at <= ? "
+                "THEN excluded.expires_at ELSE expires_at END",
+                (key, task.model_dump_json(), now + self.ttl, now),
+            )
+            self._count_put(now)
+
+    def delete(self, key: str) -> None:
+        with self.conn:
+            self.conn.execute("DELETE FROM idempotency_keys WHERE key = ?", (key,))
+
+
+def idempotency_index_factory(cfg: AppConfig) -> AbstractIdempotencyIndex:
+    if cfg.QUEUE_TYPE in ("persistent", "sharded"):
+        return SQLiteIdempotencyIndex(
+            cfg.PERSISTENT_QUEUE_PATH, ttl=cfg.IDEMPOTENCY_TTL_SECONDS
+        )
+    elif cfg.QUEUE_TYPE == "postgres":
+        from app.postgres_idempotency import PostgresIdempotencyIndex
+
+        return PostgresIdempotencyIndex(
+            cfg.DATABASE_URL, ttl=cfg.IDEMPOTENCY_TTL_SECONDS
+        )
+    else:
+        return InMemoryIdempotencyIndex(ttl=cfg.IDEMPOTENCY_TTL_SECONDS)
@@ -1,7 +1,12 @@
+import json
 import logging
+import queue
+import time
 from logging import getLogger
+from logging.handlers import QueueHandler, QueueListener
 
 LOG_PREFIX = "reliable_api_service"
+TEXT_FORMAT = "%(name)s - %(levelname)s - %(message)s"
 
 
 def get_logger(name: str):
@@ -10,12 +15,91 @@ def get_logger(name: str):
     return logger
 
 
-def set_app_log_level(level: str):
-    """level should be one of DEBUG, INFO, WARNING, ERROR"""
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            payload["suppressed"] = suppressed
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+class ThrottleFilter(logging.Filter):
+    """Rate limits records logged with extra={"throttle": True}
+
+    At most one record per logger and message template is let through every
+    interval seconds. The number of records dropped in between is attached to
+    the next one let through as `suppressed`.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__()
+        self.interval = interval
+        self._last_emitted: dict[tuple[str, str], float] = {}
+        self._suppressed: dict[tuple[str, str], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "throttle", False):
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        last = self._last_emitted.get(key)
+        if last is not None and now - last < self.interval:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return False
+        self._last_emitted[key] = now
+        record.suppressed = self._suppressed.pop(key, 0)
+        return True
+
+
+class LazyQueueHandler(QueueHandler):
+    """Hands records to the listener thread without formatting them
+
+    The stock QueueHandler formats the message in the calling thread, ie. on
+    the event loop. Here the message is only rendered by the listener, so
+    log call arguments must not be mutated after the call.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def configure_app_logging(
+    level: str, log_format: str = "text", throttle_interval: float = 10.0
+) -> QueueListener:
+    """Routes app logs through a queue so writing them never blocks the event loop
+
+    level should be one of DEBUG, INFO, WARNING, ERROR
+    log_format should be one of text, json
+    Returns the started listener, stop() it on shutdown to flush pending records.
+    """
     logger = getLogger(LOG_PREFIX)
-    ch = logging.StreamHandler()
-    ch.setLevel(level)
     logger.setLevel(level)
-    formatter = logging.Formatter("%(name)s - %(levelname)s - %(message)s")
-    ch.setFormatter(formatter)
-    logger.addHandler(ch)
+    # safe to call again, eg. once per app lifespan in tests
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setLevel(level)
+    if log_format == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(ThrottleFilter(throttle_interval))
+    logger.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    return listener
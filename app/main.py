@@ -3,31 +3,38 @@ import base64
 import logging
 import socket
 from contextlib import asynccontextmanager
+from functools import partial
+from typing import Annotated
 from urllib.parse import urlparse
 from uuid import uuid4
 
 import httpx
-from fastapi import FastAPI, HTTPException, Request, Response, status
+from fastapi import FastAPI, Header, HTTPException, Request, Response, status
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 
+import app.admin as admin
 import app.queue as queue
 import app.schemas as schemas
+from app.blob_store import AbstractBlobStore, blob_digest, blob_store_factory
 from app.config import AppConfig
 from app.constants import TEST_WEBHOOK_PATH
-from app.enums import ServiceManagerStatus, SignTaskStatus
+from app.dead_letters import AbstractDeadLetterStore, dead_letter_store_factory
+from app.enums import DeadLetterReason, ServiceManagerStatus, SignTaskStatus
 from app.env import get_app_config
-from app.logging import get_logger, set_app_log_level
+from app.http_client import HttpClients
+from app.idempotency import AbstractIdempotencyIndex, idempotency_index_factory
+from app.logging import configure_app_logging, get_logger
+from app.maintenance import queue_maintenance
+from app.monitoring import LoopLagMonitor
 from app.queue_handler import queue_handler
+from app.request_body import read_body
+from app.responses import SignTaskResponse
 from app.service_manager import UnreliableServiceManager
 
 logger = get_logger(__name__)
 
 
-def get_unreliable_service_headers(cfg: AppConfig):
-    return {"Authorization": cfg.API_KEY}
-
-
 async def validate_webhook_url(url: str) -> bool:
     """We're just validating the DNS resolution here
 
@@ -57,112 +64,304 @@ async def validate_webhook_url(url: str) -> bool:
     return True
 
 
-async def call_webhook(task: schemas.IntSignTask):
+async def call_webhook(task: schemas.IntSignTask, client: httpx.AsyncClient):
     # TODO this is likely to fail if user has set up a bad webhook url or due to network issues
     # Ideally you'd like give users ability to confirm health of the endpoint on setup
     # And ideally record of the event isn't deleted afterwards
-    logger.debug(f"Call webhook for task={task.id} url={task.webhook_url}")
+    logger.debug("Call webhook for task=%s url=%s", task.id, task.webhook_url)
     res = None
     try:
-        async with httpx.AsyncClient(timeout=1.0) as client:
-            res = await client.post(
-                task.webhook_url, json=task.sanitize().model_dump(mode="json")
-            )
+        res = await client.post(
+            task.webhook_url,
+            # the public fields straight to bytes, without a SignTask copy
+            content=task.to_json_bytes(),
+            headers={"Content-Type": SignTaskResponse.media_type},
+        )
     except httpx.RequestError:
-        logger.exception(f"Error connecting to url={task.webhook_url}")
+        logger.exception("Error connecting to url=%s", task.webhook_url)
 
     if res and res.status_code != 200:
         logger.warning(
-            f"Call webhook for task={task.id} url={task.webhook_url} failed!"
+            "Call webhook for task=%s url=%s failed!", task.id, task.webhook_url
         )
 
 
+async def on_task_success(
+    task: schemas.IntSignTask,
+    client: httpx.AsyncClient,
+    idempotency: AbstractIdempotencyIndex,
+    blobs: AbstractBlobStore,
+):
+    if task.idempotency_key:
+        # so a retry with the same key gets the signature
+        await idempotency.run(idempotency.put, task.idempotency_key, task)
+    await call_webhook(task, client)
+    if task.message_digest:
+        await blobs.run(blobs.release, task.message_digest)
+
+
+async def on_task_failure(
+    task: schemas.IntSignTask,
+    reason: DeadLetterReason,
+    last_status_code: int | None,
+    dead_letters: AbstractDeadLetterStore,
+    idempotency: AbstractIdempotencyIndex,
+):
+    # the blob is kept, a replay of the dead letter still needs it
+    await dead_letters.run(dead_letters.add, task, reason, last_status_code)
+    if task.idempotency_key:
+        # so a retry with the same key stops waiting on a pending task
+        await idempotency.run(idempotency.put, task.idempotency_key, task)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     app.state.cfg = get_app_config()
-    app.state.queue = queue.queue_factory(app.state.cfg)
-    set_app_log_level(app.state.cfg.LOG_LEVEL)
+    log_listener = configure_app_logging(
+        app.state.cfg.LOG_LEVEL,
+        log_format=app.state.cfg.LOG_FORMAT,
+        throttle_interval=app.state.cfg.LOG_THROTTLE_SECONDS,
+    )
+    app.state.clients = HttpClients(app.state.cfg)
+    warm_up_task = None
+    if app.state.cfg.UPSTREAM_WARM_UP:
+        # not waited on, the first call opens its own connection if it loses the race
+        warm_up_task = asyncio.create_task(app.state.clients.warm_up())
+    # opening the stores is blocking file or network io, do them side by side
+    (
+        app.state.queue,
+        app.state.idempotency,
+        app.state.dead_letters,
+        app.state.blobs,
+    ) = await asyncio.gather(
+        asyncio.to_thread(queue.queue_factory, app.state.cfg),
+        asyncio.to_thread(idempotency_index_factory, app.state.cfg),
+        asyncio.to_thread(dead_letter_store_factory, app.state.cfg),
+        asyncio.to_thread(blob_store_factory, app.state.cfg),
+    )
+    app.state.replay_progress = None
+    app.state.replay_task = None
     app.state.manager = UnreliableServiceManager(
-        headers=get_unreliable_service_headers(app.state.cfg)
+        client=app.state.clients.upstream,
+        max_requests_per_minute=app.state.cfg.UPSTREAM_MAX_REQUESTS_PER_MINUTE,
+        max_in_flight=app.state.cfg.UPSTREAM_MAX_IN_FLIGHT,
     )
+    stop_queue = asyncio.Event()
     queue_task = asyncio.create_task(
         queue_handler(
             ext_base_url=app.state.cfg.UNRELIABLE_SERVICE_URL,
             queue=app.state.queue,
             manager=app.state.manager,
-            on_success=call_webhook,
+            on_success=partial(
+                on_task_success,
+                client=app.state.clients.webhook,
+                idempotency=app.state.idempotency,
+                blobs=app.state.blobs,
+            ),
             max_retries=app.state.cfg.MAX_TASK_RETRIES,
+            max_in_flight=app.state.cfg.UPSTREAM_MAX_IN_FLIGHT,
+            on_failure=partial(
+                on_task_failure,
+                dead_letters=app.state.dead_letters,
+                idempotency=app.state.idempotency,
+            ),
+            stop=stop_queue,
+            drain_timeout=app.state.cfg.SHUTDOWN_DRAIN_SECONDS,
+            blobs=app.state.blobs,
         )
     )
+    app.state.loop_monitor = None
+    monitor_task = None
+    if app.state.cfg.LOOP_LAG_INTERVAL_SECONDS > 0:
+        app.state.loop_monitor = LoopLagMonitor(
+            interval=app.state.cfg.LOOP_LAG_INTERVAL_SECONDS,
+            stall_threshold=app.state.cfg.LOOP_LAG_STALL_SECONDS,
+        )
+        monitor_task = asyncio.create_task(app.state.loop_monitor.run())
+    app.state.queue_stats = None
+    maintenance_task = None
+    if app.state.cfg.QUEUE_MAINTENANCE_INTERVAL_SECONDS > 0:
+        maintenance_task = asyncio.create_task(
+            queue_maintenance(
+                app.state.queue,
+                interval=app.state.cfg.QUEUE_MAINTENANCE_INTERVAL_SECONDS,
+                batch_size=app.state.cfg.QUEUE_MAINTENANCE_BATCH_SIZE,
+                on_stats=partial(setattr, app.state, "queue_stats"),
+            )
+        )
     yield
-    queue_task.cancel()
+    # uvicorn has stopped serving requests by now, let in flight tasks
+    # finish while the clients are still open
+    stop_queue.set()
+    if app.state.replay_task is not None:
+        app.state.replay_task.cancel()
+    if maintenance_task is not None:
+        maintenance_task.cancel()
+    if monitor_task is not None:
+        monitor_task.cancel()
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    try:
+        await queue_task
+    except Exception:
+        logger.exception("Queue handler failed")
     await app.state.manager.cleanup()
+    await app.state.clients.aclose()
+    log_listener.stop()
 
 
 app = FastAPI(lifespan=lifespan)
+app.include_router(admin.router)
 
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     exc_str = f"{exc}".replace("\n", " ").replace("   ", " ")
-    logging.error(f"{request}: {exc_str}")
+    logger.error("%s: %s", request, exc_str)
     content = {"status_code": 10422, "message": exc_str, "data": None}
     return JSONResponse(
         content=content, status_code=status.HTTP_422_UNPROCESSABLE_ENTITY
     )
 
 
-@asynccontextmanager
-async def get_async_client(request: Request):
-    cfg: AppConfig = request.app.state.cfg
-    headers = get_unreliable_service_headers(cfg)
-    async with httpx.AsyncClient(headers=headers) as client:
-        yield client
-
-
 @app.get("/")
 async def root(request: Request) -> Response:
     cfg: AppConfig = request.app.state.cfg
-    async with get_async_client(request) as client:
-        r = await client.get(cfg.UNRELIABLE_SERVICE_URL)
+    r = await request.app.state.clients.upstream.get(cfg.UNRELIABLE_SERVICE_URL)
     return Response(status_code=r.status_code, content=r.content)
 
 
+@app.get("/health")
+async def health() -> dict[str, str]:
+    """Liveness, served as soon as startup has finished without touching upstream"""
+    return {"status": "ok"}
+
+
 @app.post(TEST_WEBHOOK_PATH, response_model=schemas.SignTask)
 async def test_webhook(request: Request, input_data: schemas.SignTask):
     return input_data
 
 
-@app.get("/crypto/sign", response_model=schemas.SignTask)
-async def crypto_sign(
-    request: Request,
-    response: Response,
-    message: str,
-    webhook_url: str = "",
-):
-    cfg: AppConfig = request.app.state.cfg
-    status, res = await request.app.state.manager.call(
-        method="GET", url=f"{cfg.UNRELIABLE_SERVICE_URL}/crypto/sign?message={message}"
-    )
+async def sign_message(
+    request: Request, message: str, webhook_url: str, idempotency_key: str
+) -> Response:
+    """A repeated Idempotency-Key returns the task created by the first request,
+    with its signature once signed, without calling the service or queueing again.
 
+    Messages over BLOB_THRESHOLD_BYTES are queued by reference to the blob
+    store, their task carries message_digest rather than the message.
+    """
+    cfg: AppConfig = request.app.state.cfg
+    idempotency: AbstractIdempotencyIndex = request.app.state.idempotency
+    blobs: AbstractBlobStore = request.app.state.blobs
+    task_queue: queue.AbstractQueue = request.app.state.queue
     new_task = schemas.IntSignTask(
         webhook_url=webhook_url,
         message=message,
         id=uuid4(),
         status=SignTaskStatus.PENDING,
+        idempotency_key=idempotency_key,
     )
-    if status == ServiceManagerStatus.ACK and res.status_code == 200:
-        response.status_code = 200
-        new_task.status = SignTaskStatus.SUCCESS
-        new_task.signature = base64.b64encode(res.content).decode("ascii")
-        return new_task.sanitize()
-
-    if not await validate_webhook_url(webhook_url):
-        raise HTTPException(
-            status_code=422, detail="Url did not validate or failed DNS lookup"
+    encoded = message.encode("utf-8")
+    by_reference = len(encoded) > cfg.BLOB_THRESHOLD_BYTES
+    if by_reference:
+        # the index and the queue only ever hold the digest
+        new_task.message = ""
+        new_task.message_digest = blob_digest(encoded)
+    if idempotency_key:
+        # atomic, so of concurrent requests with the key, on any replica,
+        # only the one which claims it goes on to queue a task
+        existing = await idempotency.run(idempotency.claim, idempotency_key, new_task)
+        if existing is not None:
+            return SignTaskResponse(
+                existing,
+                status_code=202 if existing.status == SignTaskStatus.PENDING else 200,
+                headers={"Idempotent-Replayed": "true"},
+            )
+    stored = False
+    try:
+        status, res = await request.app.state.manager.call(
+            method="GET",
+            url=f"{cfg.UNRELIABLE_SERVICE_URL}/crypto/sign",
+            params={"message": message},
         )
+        if status == ServiceManagerStatus.ACK and res.status_code == 200:
+            new_task.status = SignTaskStatus.SUCCESS
+            new_task.signature = base64.b64encode(res.content).decode("ascii")
+            if idempotency_key:
+                await idempotency.run(idempotency.put, idempotency_key, new_task)
+            return SignTaskResponse(new_task, status_code=200)
+
+        if not await validate_webhook_url(webhook_url):
+            raise HTTPException(
+                status_code=422, detail="Url did not validate or failed DNS lookup"
+            )
+
+        if by_reference:
+            # only once the task is going to be queued, signed on the first
+            # try it never needs the message again
+            await blobs.run(blobs.put, encoded)
+            stored = True
+        await task_queue.run(task_queue.add, new_task)
+    except BaseException:
+        # nothing was queued, let the client retry with the key, the claim
+        # would otherwise replay a task that never runs until it expires
+        if idempotency_key:
+            await idempotency.run(idempotency.delete, idempotency_key)
+        if stored:
+            await blobs.run(blobs.release, new_task.message_digest)
+        raise
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "Queue length %d",
+            await task_queue.run(len, task_queue),
+            extra={"throttle": True},
+        )
+    return SignTaskResponse(new_task, status_code=202)
+
+
+@app.get(
+    "/crypto/sign",
+    response_model=schemas.SignTask,
+    response_class=SignTaskResponse,
+    responses={202: {"model": schemas.SignTask}},
+)
+async def crypto_sign(
+    request: Request,
+    message: str,
+    webhook_url: str = "",
+    idempotency_key: Annotated[str, Header(alias="Idempotency-Key")] = "",
+):
+    return await sign_message(request, message, webhook_url, idempotency_key)
+
 
-    request.app.state.queue.add(new_task)
-    response.status_code = 202
-    logger.debug(f"Queue length {len(request.app.state.queue)}")
-    return new_task.sanitize()
+@app.post(
+    "/crypto/sign",
+    response_model=schemas.SignTask,
+    response_class=SignTaskResponse,
+    responses={202: {"model": schemas.SignTask}},
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"text/plain": {"schema": {"type": "string"}}},
+        }
+    },
+)
+async def crypto_sign_body(
+    request: Request,
+    webhook_url: str = "",
+    idempotency_key: Annotated[str, Header(alias="Idempotency-Key")] = "",
+):
+    """Signs the raw request body, for messages too large for a query string
+
+    The body may be sent with Content-Encoding: gzip, it is limited to
+    SIGN_MAX_MESSAGE_BYTES after decompression.
+    """
+    cfg: AppConfig = request.app.state.cfg
+    body = await read_body(request, cfg.SIGN_MAX_MESSAGE_BYTES)
+    try:
+        message = body.decode("utf-8")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=422, detail="Message must be UTF-8")
+    return await sign_message(request, message, webhook_url, idempotency_key)
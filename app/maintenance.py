@@ -0,0 +1,44 @@
+import asyncio
+from collections.abc import Callable
+
+from app.logging import get_logger
+from app.queue import AbstractQueue
+from app.schemas import QueueStats
+
+logger = get_logger(__name__)
+
+
+async def queue_maintenance(
+    queue: AbstractQueue,
+    interval: float,
+    batch_size: int = 1000,
+    on_stats: Callable[[QueueStats], None] | None = None,
+):
+    """Periodically compacts the queue's storage in a worker thread
+
+    Keeps the SQLite file, and with it the cost of get(), from growing with
+    every task ever processed. Queues without storage to compact return
+    None from compact() and the loop stops.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            stats = await asyncio.to_thread(queue.compact, batch_size)
+        except Exception:
+            logger.exception("Queue maintenance failed")
+            continue
+        if stats is None:
+            return
+        logger.info(
+            "Queue maintenance purged=%d file_bytes=%d wal_bytes=%d ready=%d "
+            "unacked=%d acked=%d ack_failed=%d",
+            stats.purged,
+            stats.file_bytes,
+            stats.wal_bytes,
+            stats.ready,
+            stats.unacked,
+            stats.acked,
+            stats.ack_failed,
+        )
+        if on_stats is not None:
+            on_stats(stats)
@@ -0,0 +1,122 @@
+import asyncio
+import bisect
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+
+from app.logging import get_logger
+from app.schemas import LoopLagReport, LoopStall
+
+logger = get_logger(__name__)
+
+LAG_BUCKET_BOUNDS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop runs a callback scheduled every interval
+
+    A watchdog thread also checks the loop is still ticking. When it has been
+    blocked for longer than stall_threshold, the stack of the loop thread is
+    captured, ie. the code blocking it, eg. a sync SQLite call.
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.1,
+        stall_threshold: float = 0.1,
+        max_stalls: int = 20,
+    ):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.counts = [0] * (len(LAG_BUCKET_BOUNDS) + 1)
+        self.samples = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls: deque[LoopStall] = deque(maxlen=max_stalls)
+        self._beats = 0
+        self._last_beat = time.monotonic()
+        self._loop_thread_id: int | None = None
+        self._stopped = threading.Event()
+
+    def record(self, lag: float) -> None:
+        self.counts[bisect.bisect_left(LAG_BUCKET_BOUNDS, lag)] += 1
+        self.samples += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+
+    def _watch(self) -> None:
+        captured_beat = -1
+        while not self._stopped.wait(self.stall_threshold / 2):
+            beat = self._beats
+            blocked = time.monotonic() - self._last_beat - self.interval
+            # one capture per stall
+            if blocked > self.stall_threshold and beat != captured_beat:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is None:
+                    continue
+                captured_beat = beat
+                stack = [line.rstrip() for line in traceback.format_stack(frame)]
+                self.stalls.append(
+                    LoopStall(time=time.time(), blocked_seconds=blocked, stack=stack)
+                )
+                logger.warning("Event loop blocked for %.3fs", blocked)
+
+    async def run(self):
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        watchdog = threading.Thread(
+            target=self._watch, name="loop-lag-watchdog", daemon=True
+        )
+        watchdog.start()
+        try:
+            while True:
+                expected = time.monotonic() + self.interval
+                await asyncio.sleep(self.interval)
+                now = time.monotonic()
+                self.record(max(0.0, now - expected))
+                self._last_beat = now
+                self._beats += 1
+        finally:
+            self._stopped.set()
+
+    def report(self) -> LoopLagReport:
+        return LoopLagReport(
+            bucket_bounds=list(LAG_BUCKET_BOUNDS),
+            counts=list(self.counts),
+            samples=self.samples,
+            max_lag=self.max_lag,
+            mean_lag=self.total_lag / self.samples if self.samples else 0.0,
+            stalls=list(self.stalls),
+        )
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def sample_profile(seconds: float, interval: float = 0.005) -> str:
+    """Samples the stacks of every other thread for seconds
+
+    Blocking, run it in a thread. Returns collapsed stacks, one
+    "thread;outer;...;inner count" line per distinct stack, the input format
+    of flamegraph.pl and speedscope.
+    """
+    own_id = threading.get_ident()
+    thread_names = {t.ident: t.name for t in threading.enumerate()}
+    stacks: Counter[str] = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            thread_name = thread_names.get(thread_id, str(thread_id))
+            stacks[f"{thread_name};{_collapse(frame)}"] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
@@ -0,0 +1,45 @@
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert
+
+from app.blob_store import AbstractBlobStore, blob_digest
+from app.db import create_db_engine, message_blobs
+
+
+class PostgresBlobStore(AbstractBlobStore):
+    """Blobs shared between replicas, whichever one dequeues the task reads it"""
+
+    in_thread = True
+
+    def __init__(self, url: str | sa.Engine):
+        self.engine = url if isinstance(url, sa.Engine) else create_db_engine(url)
+
+    def put(self, data: bytes) -> str:
+        digest = blob_digest(data)
+        upsert = (
+            insert(message_blobs)
+            .values(digest=digest, data=data, refs=1)
+            .on_conflict_do_update(
+                index_elements=["digest"], set_={"refs": message_blobs.c.refs + 1}
+            )
+        )
+        with self.engine.begin() as conn:
+            conn.execute(upsert)
+        return digest
+
+    def get(self, digest: str) -> bytes | None:
+        query = sa.select(message_blobs.c.data).where(message_blobs.c.digest == digest)
+        with self.engine.connect() as conn:
+            return conn.execute(query).scalar_one_or_none()
+
+    def release(self, digest: str) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(
+                sa.update(message_blobs)
+                .where(message_blobs.c.digest == digest)
+                .values(refs=message_blobs.c.refs - 1)
+            )
+            conn.execute(
+                sa.delete(message_blobs).where(
+                    message_blobs.c.digest == digest, message_blobs.c.refs <= 0
+                )
+            )
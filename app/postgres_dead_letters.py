@@ -0,0 +1,91 @@
+from collections.abc import Iterable
+from uuid import UUID
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert
+
+from app.db import create_db_engine, dead_letters
+from app.dead_letters import AbstractDeadLetterStore
+from app.enums import DeadLetterReason
+from app.schemas import DeadLetter, DeadLetterFilter, IntSignTask
+
+
+class PostgresDeadLetterStore(AbstractDeadLetterStore):
+    """Dead letters shared between replicas, any of them can replay them"""
+
+    in_thread = True
+
+    def __init__(self, url: str | sa.Engine):
+        self.engine = url if isinstance(url, sa.Engine) else create_db_engine(url)
+
+    @staticmethod
+    def _where(where: DeadLetterFilter) -> list[sa.ColumnElement[bool]]:
+        clauses = []
+        if where.since is not None:
+            clauses.append(dead_letters.c.last_failed_at >= where.since)
+        if where.until is not None:
+            clauses.append(dead_letters.c.last_failed_at < where.until)
+        if where.reason is not None:
+            clauses.append(dead_letters.c.reason == where.reason.value)
+        if where.status_code is not None:
+            clauses.append(dead_letters.c.last_status_code == where.status_code)
+        return clauses
+
+    def add(
+        self,
+        task: IntSignTask,
+        reason: DeadLetterReason,
+        last_status_code: int | None = None,
+    ) -> None:
+        values = {
+            "task": task.model_dump(mode="json"),
+            "reason": reason.value,
+            "last_status_code": last_status_code,
+            "last_failed_at": sa.func.now(),
+        }
+        upsert = (
+            insert(dead_letters)
+            .values(
+                task_id=task.id, first_failed_at=sa.func.now(), failures=1, **values
+            )
+            .on_conflict_do_update(
+                index_elements=["task_id"],
+                set_={**values, "failures": dead_letters.c.failures + 1},
+            )
+        )
+        with self.engine.begin() as conn:
+            conn.execute(upsert)
+
+    def find(self, where: DeadLetterFilter, limit: int = 100) -> list[DeadLetter]:
+        query = (
+            sa.select(
+                dead_letters.c.task,
+                dead_letters.c.reason,
+                dead_letters.c.last_status_code,
+                dead_letters.c.first_failed_at,
+                dead_letters.c.last_failed_at,
+                dead_letters.c.failures,
+            )
+            .where(*self._where(where))
+            .order_by(dead_letters.c.last_failed_at)
+            .limit(limit)
+        )
+        with self.engine.connect() as conn:
+            rows = conn.execute(query).mappings().all()
+        return [DeadLetter.model_validate(dict(row)) for row in rows]
+
+    def count(self, where: DeadLetterFilter) -> int:
+        query = (
+            sa.select(sa.func.count())
+            .select_from(dead_letters)
+            .where(*self._where(where))
+        )
+        with self.engine.connect() as conn:
+            return conn.execute(query).scalar_one()
+
+    def delete(self, task_ids: Iterable[UUID]) -> int:
+        query = sa.delete(dead_letters).where(
+            dead_letters.c.task_id.in_(list(task_ids))
+        )
+        with self.engine.begin() as conn:
+            return conn.execute(query).rowcount
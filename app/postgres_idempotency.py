@@ -0,0 +1,93 @@
+from datetime import timedelta
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert
+
+from app.db import create_db_engine, idempotency_keys
+from app.idempotency import DEFAULT_TTL_SECONDS, AbstractIdempotencyIndex
+from app.schemas import IntSignTask
+
+
+class PostgresIdempotencyIndex(AbstractIdempotencyIndex):
+    """Keys shared between replicas, so a retry can land on any of them"""
+
+    in_thread = True
+
+    # number of puts between sweeps of expired keys
+    PURGE_EVERY = 1000
+
+    def __init__(self, url: str | sa.Engine, ttl: float = DEFAULT_TTL_SECONDS):
+        self.engine = url if isinstance(url, sa.Engine) else create_db_engine(url)
+        self.ttl = timedelta(seconds=ttl)
+        self._puts = 0
+
+    def get(self, key: str) -> IntSignTask | None:
+        query = sa.select(idempotency_keys.c.task).where(
+            idempotency_keys.c.key == key,
+            idempotency_keys.c.expires_at > sa.func.now(),
+        )
+        with self.engine.connect() as conn:
+            task = conn.execute(query).scalar_one_or_none()
+        if task is None:
+            return None
+        return IntSignTask.model_validate(task)
+
+    def _count_put(self, conn: sa.Connection) -> None:
+        self._puts += 1
+        if self._puts % self.PURGE_EVERY == 0:
+            conn.execute(
+                sa.delete(idempotency_keys).where(
+                    idempotency_keys.c.expires_at <= sa.func.now()
+                )
+            )
+
+    def claim(self, key: str, task: IntSignTask) -> IntSignTask | None:
+        payload = task.model_dump(mode="json")
+        claim = insert(idempotency_keys).values(
+            key=key, task=payload, expires_at=sa.func.now() + self.ttl
+        )
+        # a concurrent insert of the same key waits for this one to commit,
+        # then finds a live row and returns nothing
+        claim = claim.on_conflict_do_update(
+            index_elements=["key"],
+            set_={"task": payload, "expires_at": claim.excluded.expires_at},
+            where=idempotency_keys.c.expires_at <= sa.func.now(),
+        ).returning(idempotency_keys.c.key)
+        while True:
+            with self.engine.begin() as conn:
+                if conn.execute(claim).first() is not None:
+                    self._count_put(conn)
+                    return None
+            existing = self.get(key)
+            if existing is not None:
+                return existing
+            # deleted by the request which held it since, claim it again
+
+    def put(self, key: str, task: IntSignTask) -> None:
+        payload = task.model_dump(mode="json")
+        upsert = insert(idempotency_keys).values(
+            key=key, task=payload, expires_at=sa.func.now() + self.ttl
+        )
+        upsert = upsert.on_conflict_do_update(
+            index_elements=["key"],
+            set_={
+                "task": payload,
+                # an expired key which hasn't been swept yet is claimed afresh
+                "expires_at": sa.case(
+                    (
+                        idempotency_keys.c.expires_at <= sa.func.now(),
+                        upsert.excluded.expires_at,
+                    ),
+                    else_=idempotency_keys.c.expires_at,
+                ),
+            },
+        )
+        with self.engine.begin() as conn:
+            conn.execute(upsert)
+            self._count_put(conn)
+
+    def delete(self, key: str) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(
+                sa.delete(idempotency_keys).where(idempotency_keys.c.key == key)
+            )
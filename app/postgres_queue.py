@@ -0,0 +1,126 @@
+import asyncio
+from collections.abc import AsyncGenerator, Generator, Iterable
+from contextlib import asynccontextmanager, contextmanager
+from datetime import timedelta
+
+import sqlalchemy as sa
+
+from app.db import create_db_engine, sign_tasks
+from app.enums import SignTaskStatus
+from app.queue import AbstractQueue
+from app.schemas import IntSignTask
+
+
+class PostgresQueue(AbstractQueue):
+    """Queue shared between any number of replicas
+
+    get() leases the oldest ready task with SELECT ... FOR UPDATE SKIP LOCKED,
+    so concurrent consumers never block on or receive the same row. The lease
+    is released when the context exits, or expires after lease_seconds if the
+    consumer died holding it. Lease expiry is the recovery, a task leased by
+    a crashed replica is ready again without any step on startup, so
+    recover() is left as the no-op. The schema is managed by alembic.
+    """
+
+    in_thread = True
+
+    def __init__(self, url: str | sa.Engine, lease_seconds: float = 60.0):
+        self.engine = url if isinstance(url, sa.Engine) else create_db_engine(url)
+        self.lease = timedelta(seconds=lease_seconds)
+
+    @staticmethod
+    def _row(x: IntSignTask) -> dict:
+        return {
+            "id": x.id,
+            "status": x.status.value,
+            "payload": x.model_dump(mode="json"),
+        }
+
+    def add(self, x: IntSignTask) -> None:
+        self.add_many([x])
+
+    def add_many(self, xs: Iterable[IntSignTask]) -> None:
+        rows = [self._row(x) for x in xs]
+        if not rows:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(sa.insert(sign_tasks), rows)
+
+    def _lease(self) -> sa.Row | None:
+        now = sa.func.now()
+        ready = (
+            sa.select(sign_tasks.c.id, sign_tasks.c.payload)
+            .where(
+                sign_tasks.c.status == SignTaskStatus.PENDING.value,
+                sign_tasks.c.ready_at <= now,
+                sa.or_(
+                    sign_tasks.c.leased_until.is_(None),
+                    sign_tasks.c.leased_until < now,
+                ),
+            )
+            .order_by(sign_tasks.c.ready_at, sign_tasks.c.seq)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        with self.engine.begin() as conn:
+            row = conn.execute(ready).first()
+            if row is not None:
+                conn.execute(
+                    sa.update(sign_tasks)
+                    .where(sign_tasks.c.id == row.id)
+                    .values(leased_until=now + self.lease)
+                )
+        return row
+
+    def _release(self, x: IntSignTask) -> None:
+        with self.engine.begin() as conn:
+            if x.status != SignTaskStatus.PENDING:
+                # a failed task is kept by the dead letter store, and a replay
+                # adds it back under the same id
+                conn.execute(sa.delete(sign_tasks).where(sign_tasks.c.id == x.id))
+            else:
+                # back to the queue in place
+                conn.execute(
+                    sa.update(sign_tasks)
+                    .where(sign_tasks.c.id == x.id)
+                    .values(
+                        status=x.status.value,
+                        payload=x.model_dump(mode="json"),
+                        leased_until=None,
+                    )
+                )
+
+    @contextmanager
+    def get(self) -> Generator[IntSignTask | None, None, None]:
+        row = self._lease()
+        if row is not None:
+            item = IntSignTask.model_validate(row.payload)
+            try:
+                yield item
+            finally:
+                # also on cancel, so a drained task is ready again straight away
+                self._release(item)
+        else:
+            yield None
+
+    @asynccontextmanager
+    async def aget(self) -> AsyncGenerator[IntSignTask | None, None]:
+        row = await asyncio.to_thread(self._lease)
+        if row is None:
+            yield None
+            return
+        item = IntSignTask.model_validate(row.payload)
+        try:
+            yield item
+        finally:
+            # the thread carries on releasing even if this is cancelled again
+            await asyncio.to_thread(self._release, item)
+
+    def __len__(self) -> int:
+        count = (
+            sa.select(sa.func.count())
+            .select_from(sign_tasks)
+            .where(sign_tasks.c.status == SignTaskStatus.PENDING.value)
+        )
+        with self.engine.connect() as conn:
+            return conn.execute(count).scalar_one()
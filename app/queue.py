@@ -1,27 +1,54 @@
+import time
 from abc import ABC
 from collections import deque
-from collections.abc import Generator
-from contextlib import contextmanager
-
-import persistqueue
+from collections.abc import AsyncGenerator, Generator, Iterable
+from contextlib import asynccontextmanager, contextmanager
 
+from app.blocking import BlockingStore
 from app.config import AppConfig
 from app.enums import SignTaskStatus
-from app.schemas import IntSignTask
+from app.logging import get_logger
+from app.schemas import IntSignTask, QueueStats
+
+logger = get_logger(__name__)
 
 
-class AbstractQueue(ABC):
+class AbstractQueue(BlockingStore, ABC):
 
     def add(self, x: IntSignTask) -> None:
         pass
 
+    def add_many(self, xs: Iterable[IntSignTask]) -> None:
+        for x in xs:
+            self.add(x)
+
     @contextmanager
     def get(self) -> Generator[IntSignTask | None, None, None]:
         pass
 
+    @asynccontextmanager
+    async def aget(self) -> AsyncGenerator[IntSignTask | None, None]:
+        """get() for the event loop"""
+        with self.get() as item:
+            yield item
+
     def __len__(self) -> int:
         pass
 
+    def recover(self) -> int:
+        """Returns tasks left taken by a consumer which died to the queue
+
+        Run once on startup, returns the number of tasks requeued.
+        """
+        return 0
+
+    def compact(self, batch_size: int = 1000) -> QueueStats | None:
+        """Reclaims storage held by finished tasks, returns None if not applicable
+
+        Blocking, run it in a thread off the event loop.
+        """
+        return None
+
 
 class InMemoryQueue(AbstractQueue):
 
@@ -33,15 +60,15 @@ class InMemoryQueue(AbstractQueue):
 
     @contextmanager
     def get(self) -> Generator[IntSignTask | None, None, None]:
+        # taken off the queue while in use so concurrent consumers
+        # are handed different tasks
         if len(self.queue):
-            item = self.queue[-1]
-            yield item
-            if item.status == SignTaskStatus.SUCCESS:
-                self.queue.pop()
-            elif item.status == SignTaskStatus.FAIL:
-                self.queue.pop()
-            else:
-                pass  # just leave it there
+            item = self.queue.pop()
+            try:
+                yield item
+            finally:
+                if item.status == SignTaskStatus.PENDING:
+                    self.queue.append(item)  # return it to the head
         else:
             yield None
 
@@ -49,34 +76,57 @@ class InMemoryQueue(AbstractQueue):
         return len(self.queue)
 
 
-class PersistentQueue(AbstractQueue):
-
-    def __init__(self, db_path: str):
-        self.queue = persistqueue.SQLiteAckQueue(db_path, auto_commit=True)
-
-    def add(self, x: IntSignTask) -> None:
-        self.queue.put(x)
-
-    @contextmanager
-    def get(self) -> Generator[IntSignTask | None, None, None]:
-        if len(self):
-            item = self.queue.get()
-            yield item
-            if item.status == SignTaskStatus.SUCCESS:
-                self.queue.ack(item)
-            elif item.status == SignTaskStatus.FAIL:
-                self.queue.ack_failed(item)
-            else:
-                self.queue.nack(item)  # return it to the queue
-        else:
-            yield None
-
-    def __len__(self) -> int:
-        return self.queue.active_size()
-
-
-def queue_factory(cfg: AppConfig) -> AbstractQueue:
+def _open_queue(cfg: AppConfig) -> AbstractQueue:
     if cfg.QUEUE_TYPE == "persistent":
-        return PersistentQueue(cfg.PERSISTENT_QUEUE_PATH)
+        from app.sqlite_queue import PersistentQueue
+
+        return PersistentQueue(
+            cfg.PERSISTENT_QUEUE_PATH,
+            multithreading=True,
+            synchronous=cfg.SQLITE_SYNCHRONOUS,
+        )
+    elif cfg.QUEUE_TYPE == "sharded":
+        from app.sqlite_queue import ShardedPersistentQueue
+
+        return ShardedPersistentQueue(
+            cfg.PERSISTENT_QUEUE_PATH,
+            num_shards=cfg.PERSISTENT_QUEUE_SHARDS,
+            multithreading=True,
+            synchronous=cfg.SQLITE_SYNCHRONOUS,
+        )
+    elif cfg.QUEUE_TYPE == "postgres":
+        from app.postgres_queue import PostgresQueue
+
+        return PostgresQueue(cfg.DATABASE_URL, lease_seconds=cfg.QUEUE_LEASE_SECONDS)
+    elif cfg.QUEUE_TYPE == "tiered":
+        from app.tiered_queue import TieredQueue
+
+        return TieredQueue(
+            cfg.PERSISTENT_QUEUE_PATH,
+            max_memory_bytes=cfg.TIERED_QUEUE_MAX_MEMORY_BYTES,
+            segment_tasks=cfg.TIERED_QUEUE_SEGMENT_TASKS,
+        )
     else:
         return InMemoryQueue()
+
+
+def queue_factory(cfg: AppConfig) -> AbstractQueue:
+    """Backends are imported here so only the selected one is ever loaded
+
+    Blocking, opening a persistent queue can vacuum or scan the database. The
+    sqlite backends are opened with multithreading so this can run in a worker
+    thread while the rest of startup carries on.
+
+    Tasks a previous run took but never finished are requeued before the
+    queue is returned.
+    """
+    queue = _open_queue(cfg)
+    start = time.perf_counter()
+    recovered = queue.recover()
+    if recovered:
+        logger.info(
+            "Recovered %d unfinished tasks in %.3fs",
+            recovered,
+            time.perf_counter() - start,
+        )
+    return queue
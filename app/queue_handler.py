@@ -1,54 +1,176 @@
 import asyncio
 import base64
+import logging
 from collections.abc import Awaitable, Callable
 
 from app import queue, schemas
+from app.blob_store import AbstractBlobStore
 from app.constants import DEFAULT_MAX_TASK_RETRIES
-from app.enums import ServiceManagerStatus
+from app.enums import DeadLetterReason, ServiceManagerStatus, SignTaskStatus
 from app.logging import get_logger
 from app.service_manager import UnreliableServiceManager
 
 logger = get_logger(__name__)
 
 
+OnFailure = Callable[
+    [schemas.IntSignTask, DeadLetterReason, int | None], Awaitable[None]
+]
+
+
+async def dead_letter(
+    task: schemas.IntSignTask,
+    on_failure: OnFailure | None,
+    reason: DeadLetterReason,
+    last_status_code: int | None = None,
+):
+    task.mark_failed()
+    if on_failure is None:
+        return
+    try:
+        await on_failure(task, reason, last_status_code)
+    except Exception:
+        # left on the queue rather than lost
+        logger.exception("Dead lettering task %s failed", task.id)
+        task.status = SignTaskStatus.PENDING
+
+
+async def process_task(
+    ext_base_url: str,
+    queue: queue.AbstractQueue,
+    manager: UnreliableServiceManager,
+    on_success: Callable[[schemas.IntSignTask], Awaitable[None]],
+    max_retries: int = DEFAULT_MAX_TASK_RETRIES,
+    on_failure: OnFailure | None = None,
+    blobs: AbstractBlobStore | None = None,
+):
+    """Takes the task at the head of the queue and tries to sign it once
+
+    on_failure is called with the reason and the last upstream status code
+    once a task can't be signed, before it is removed from the queue.
+    A task queued with a message_digest has its message read from blobs.
+    """
+    async with queue.aget() as task:
+        if not task:
+            return
+        message = task.message
+        if task.message_digest:
+            data = None
+            if blobs is not None:
+                data = await blobs.run(blobs.get, task.message_digest)
+            if data is None:
+                logger.error(
+                    "Message %s of task %s is missing", task.message_digest, task.id
+                )
+                await dead_letter(task, on_failure, DeadLetterReason.MISSING_MESSAGE)
+                return
+            message = data.decode("utf-8")
+        try:
+            status, res = await manager.call(
+                method="GET",
+                url=f"{ext_base_url}/crypto/sign",
+                params={"message": message},
+            )
+        except Exception:
+            logger.exception("Call to manager failed")
+            return
+        if status == ServiceManagerStatus.ACK:
+            if res.status_code == 200:
+                signed = task.model_copy()
+                signed.mark_done()
+                signed.signature = base64.b64encode(res.content).decode("ascii")
+                # what if this webhook fails? need a backup
+                await on_success(signed)
+                # only now, a webhook cut off by the drain timeout leaves the
+                # task pending, so it is returned to the queue rather than acked
+                task.mark_done()
+                logger.debug("Task %s succeeded", task.id)
+            else:
+                task.inc_retries()
+                if task.num_retries >= max_retries:
+                    logger.debug(
+                        "Task %s exceeded max retries=%d, dead lettering...",
+                        task.id,
+                        max_retries,
+                    )
+                    await dead_letter(
+                        task, on_failure, DeadLetterReason.MAX_RETRIES, res.status_code
+                    )
+
+
+def log_task_error(processing: asyncio.Task) -> None:
+    """Done callback, nothing else retrieves the exception of a processing task"""
+    if not processing.cancelled() and processing.exception() is not None:
+        logger.error("Processing a task failed", exc_info=processing.exception())
+
+
 async def queue_handler(
     ext_base_url: str,
-    queue: queue.InMemoryQueue,
+    queue: queue.AbstractQueue,
     manager: UnreliableServiceManager,
     on_success: Callable[[schemas.IntSignTask], Awaitable[None]],
     max_retries: int = DEFAULT_MAX_TASK_RETRIES,
+    max_in_flight: int = 1,
+    on_failure: OnFailure | None = None,
+    stop: asyncio.Event | None = None,
+    drain_timeout: float = 5.0,
+    blobs: AbstractBlobStore | None = None,
 ):
+    """Dispatches a queued task every manager.time_step
+
+    Each task is processed in its own asyncio task, so the next one can be
+    dispatched without waiting for the previous response. At most
+    max_in_flight tasks are being processed at once.
+
+    Once stop is set no more tasks are taken. Those in flight get up to
+    drain_timeout seconds to finish, including their webhook, then are
+    cancelled and returned to the queue before this returns.
+    """
+    stopped = asyncio.create_task((stop or asyncio.Event()).wait())
+    in_flight: set[asyncio.Task] = set()
     try:
-        while True:
-            with queue.get() as task:
-                if task:
-                    try:
-                        status, res = await manager.call(
-                            method="GET",
-                            url=f"{ext_base_url}/crypto/sign?message={task.message}",
-                        )
-                    except Exception:
-                        logger.exception("Call to manager failed")
-                    if status == ServiceManagerStatus.ACK:
-                        if res.status_code == 200:
-                            task.mark_done()
-                            task.signature = base64.b64encode(res.content).decode(
-                                "ascii"
-                            )
-                            # what if this webhook fails? need a backup
-                            await on_success(task)
-                            logger.debug(f"Task {task.id} succeeded")
-                        else:
-                            task.inc_retries()
-                            if task.num_retries >= max_retries:
-                                # for now let's just delete
-                                # TODO setup permanent DB storage/ dead letter queue
-                                task.mark_failed()
-                                logger.debug(
-                                    f"Task {task.id} exceeded max retries={max_retries}, deleting..."
-                                )
-
-            logger.debug(f"queue_len={len(queue)}")
-            await asyncio.sleep(manager.time_step)
+        while not stopped.done():
+            if len(in_flight) < max_in_flight:
+                processing = asyncio.create_task(
+                    process_task(
+                        ext_base_url,
+                        queue,
+                        manager,
+                        on_success,
+                        max_retries,
+                        on_failure,
+                        blobs=blobs,
+                    )
+                )
+                in_flight.add(processing)
+                processing.add_done_callback(in_flight.discard)
+                processing.add_done_callback(log_task_error)
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "queue_len=%d",
+                    await queue.run(len, queue),
+                    extra={"throttle": True},
+                )
+            # woken early by stop, so shutdown doesn't wait out a time step
+            await asyncio.wait([stopped], timeout=manager.time_step)
+        if in_flight:
+            logger.info("Draining %d in flight tasks", len(in_flight))
+            await asyncio.wait(in_flight, timeout=drain_timeout)
+            unfinished = [
+                processing for processing in in_flight if not processing.done()
+            ]
+            for processing in unfinished:
+                processing.cancel()
+            if unfinished:
+                logger.warning(
+                    "Returned %d unfinished tasks to the queue", len(unfinished)
+                )
+                # their get() contexts requeue them as they unwind
+                await asyncio.gather(*unfinished, return_exceptions=True)
     except InterruptedError as err:
         return
+    finally:
+        stopped.cancel()
+        for processing in in_flight:
+            processing.cancel()
@@ -0,0 +1,54 @@
+import zlib
+
+from fastapi import HTTPException, Request
+
+# zlib wbits which only accepts a gzip header and trailer
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+async def read_body(request: Request, max_bytes: int) -> bytes:
+    """Streams the request body, decompressing Content-Encoding: gzip
+
+    Stops as soon as the body, after decompression, goes over max_bytes.
+    Each chunk is only inflated up to the bytes still allowed, so a small
+    gzip bomb can't expand into memory first.
+    """
+    encoding = request.headers.get("content-encoding", "identity").lower()
+    if encoding not in ("identity", "gzip"):
+        raise HTTPException(
+            status_code=415, detail=f"Unsupported Content-Encoding {encoding}"
+        )
+    too_large = HTTPException(
+        status_code=413, detail=f"Message is over {max_bytes} bytes"
+    )
+    trailing_data = HTTPException(
+        status_code=400, detail="Body has data after the gzip stream"
+    )
+    content_length = request.headers.get("content-length", "")
+    if encoding == "identity" and content_length.isdigit():
+        if int(content_length) > max_bytes:
+            raise too_large
+
+    decompressor = zlib.decompressobj(GZIP_WBITS) if encoding == "gzip" else None
+    chunks = []
+    size = 0
+    try:
+        async for chunk in request.stream():
+            if decompressor is not None:
+                # past the end of the stream input is buffered in unused_data
+                # without adding to size, so would escape the limit
+                if decompressor.eof and chunk:
+                    raise trailing_data
+                # a full max_length of output means the limit is already passed
+                chunk = decompressor.decompress(chunk, max_bytes - size + 1)
+                if decompressor.unused_data:
+                    raise trailing_data
+            size += len(chunk)
+            if size > max_bytes:
+                raise too_large
+            chunks.append(chunk)
+    except zlib.error:
+        raise HTTPException(status_code=400, detail="Body is not valid gzip")
+    if decompressor is not None and not decompressor.eof:
+        raise HTTPException(status_code=400, detail="Body is truncated gzip")
+    return b"".join(chunks)
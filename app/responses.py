@@ -0,0 +1,23 @@
+from typing import Any
+
+from fastapi.responses import Response
+
+from app.schemas import SignTask
+
+
+class SignTaskResponse(Response):
+    """JSON response for a sign task which skips FastAPI's response validation
+
+    Returning a Response instance from an endpoint bypasses the response_model
+    round trip, so the task goes straight from the internal model to bytes.
+    Already encoded bytes are passed through untouched.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        if isinstance(content, SignTask):
+            return content.to_json_bytes()
+        raise TypeError(f"Cannot render {type(content).__name__} as a SignTask")
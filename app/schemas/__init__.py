@@ -1 +1,4 @@
+from .dead_letter import DeadLetter, DeadLetterFilter, DeadLetterPage, ReplayProgress
 from .messages import IntSignTask, SignTask
+from .monitoring import LoopLagReport, LoopStall
+from .queue import QueueStats
@@ -0,0 +1,51 @@
+from datetime import datetime, timezone
+
+from pydantic import BaseModel, Field, field_validator
+
+from app.enums import DeadLetterReason
+
+from .messages import IntSignTask
+
+
+class DeadLetter(BaseModel):
+    """A task which ran out of retries, kept so it can be inspected and replayed"""
+
+    task: IntSignTask
+    reason: DeadLetterReason
+    last_status_code: int | None = Field(
+        default=None, description="Upstream status code of the last attempt"
+    )
+    first_failed_at: datetime = Field(description="When first dead lettered")
+    last_failed_at: datetime = Field(description="When last dead lettered")
+    failures: int = Field(
+        default=1, description="Times dead lettered, more than once after replays"
+    )
+
+
+class DeadLetterFilter(BaseModel):
+    """Selects dead letters, unset fields match everything"""
+
+    since: datetime | None = Field(default=None, description="last_failed_at >= since")
+    until: datetime | None = Field(default=None, description="last_failed_at < until")
+    reason: DeadLetterReason | None = None
+    status_code: int | None = Field(default=None, description="last_status_code")
+
+    @field_validator("since", "until")
+    @classmethod
+    def naive_times_are_utc(cls, value: datetime | None) -> datetime | None:
+        if value is not None and value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value
+
+
+class DeadLetterPage(BaseModel):
+    total: int = Field(description="Number of dead letters matching the filter")
+    items: list[DeadLetter] = Field(description="Oldest first")
+
+
+class ReplayProgress(BaseModel):
+    matched: int = Field(description="Dead letters matching when the replay started")
+    replayed: int = Field(default=0, description="Moved back onto the queue so far")
+    running: bool = Field(default=True)
+    started_at: datetime
+    finished_at: datetime | None = None
@@ -16,11 +16,33 @@ class SignTask(BaseModel):
         description="Provided on success, base64 encoded",
     )
 
+    def to_json_bytes(self) -> bytes:
+        """Serialize the public fields straight to JSON
+
+        Skips building an intermediate SignTask and re-validating it,
+        the encoding is done by pydantic-core in a single pass.
+        """
+        return self.model_dump_json(include=PUBLIC_FIELDS).encode()
+
+
+PUBLIC_FIELDS = frozenset(SignTask.model_fields)
+
 
 class IntSignTask(SignTask):
     """Internal class"""
 
     num_retries: int = Field(default=0)
+    idempotency_key: str = Field(default="")
+    # set instead of message when the message is held in the blob store
+    message_digest: str = Field(default="")
+
+    def __setstate__(self, state: dict) -> None:
+        # tasks pickled into the persistent queue by an older release lack
+        # the fields added since, give them their defaults
+        for name, field in type(self).model_fields.items():
+            if not field.is_required():
+                state["__dict__"].setdefault(name, field.get_default())
+        super().__setstate__(state)
 
     def inc_retries(self):
         self.num_retries += 1
@@ -31,5 +53,10 @@ class IntSignTask(SignTask):
     def mark_failed(self):
         self.status = SignTaskStatus.FAIL
 
+    def reset(self):
+        """Back to a fresh pending task, for a replay from the dead letters"""
+        self.status = SignTaskStatus.PENDING
+        self.num_retries = 0
+
     def sanitize(self) -> SignTask:
         return SignTask.model_validate(self.model_dump())
@@ -0,0 +1,24 @@
+from pydantic import BaseModel, Field
+
+
+class LoopStall(BaseModel):
+    time: float = Field(description="Unix time the stall was caught")
+    blocked_seconds: float = Field(description="How long the loop had been blocked")
+    stack: list[str] = Field(
+        description="Stack of the event loop thread, innermost last"
+    )
+
+
+class LoopLagReport(BaseModel):
+    """Scheduling delay of the event loop
+
+    counts[i] is the number of samples with lag <= bucket_bounds[i],
+    the final count is for samples above the last bound.
+    """
+
+    bucket_bounds: list[float]
+    counts: list[int]
+    samples: int
+    max_lag: float
+    mean_lag: float
+    stalls: list[LoopStall]
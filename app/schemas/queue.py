@@ -0,0 +1,21 @@
+from pydantic import BaseModel, Field
+
+
+class QueueStats(BaseModel):
+    """Storage report from a maintenance pass over a persistent queue"""
+
+    file_bytes: int = Field(default=0, description="Size of the database file")
+    wal_bytes: int = Field(default=0, description="Size of the write ahead log")
+    ready: int = Field(default=0)
+    unacked: int = Field(default=0)
+    acked: int = Field(default=0, description="Acked rows left after purging")
+    ack_failed: int = Field(default=0)
+    purged: int = Field(default=0, description="Acked rows deleted by this pass")
+
+    def __add__(self, other: "QueueStats") -> "QueueStats":
+        return QueueStats.model_validate(
+            {
+                name: getattr(self, name) + getattr(other, name)
+                for name in QueueStats.model_fields
+            }
+        )
@@ -1,4 +1,3 @@
-import asyncio
 import time
 
 import httpx
@@ -10,41 +9,73 @@ logger = get_logger(__name__)
 
 
 class UnreliableServiceManager:
+    """Gates calls to the external service
 
-    def __init__(self, headers: dict[str, str] = {}, max_requests_per_minute: int = 10):
+    Rate and concurrency are limited separately: a call may only start
+    time_step seconds after the previous one started, and at most
+    max_in_flight calls can be awaiting a response at once. So a slow
+    upstream doesn't drop the effective rate below the allowed budget.
+    """
+
+    def __init__(
+        self,
+        headers: dict[str, str] = {},
+        max_requests_per_minute: int = 10,
+        client: httpx.AsyncClient | None = None,
+        max_in_flight: int = 1,
+    ):
+        """client: shared client to use, it is then owned and closed by the caller"""
         self.time_step = 60.0 / max_requests_per_minute
-        self.client = httpx.AsyncClient(headers=headers)
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._owns_client = client is None
+        if client is None:
+            client = httpx.AsyncClient(headers=headers)
+        self.client = client
         self.last_time = time.time() - (self.time_step * 1.1)
-        self.lock = asyncio.Lock()
 
     async def _make_request(
         self, method: str, url: str, *args, **kwargs
     ) -> httpx.Response | None:
-        logger.debug(f"Making external request to {url}")
+        logger.debug("Making external request to %s", url)
         try:
             resp = await self.client.request(method=method, url=url, *args, **kwargs)
         except httpx.RequestError:
-            logger.exception(f"Error connecting to {url}")
+            logger.exception("Error connecting to %s", url)
             return None
 
-        logger.debug(f"Response status={resp.status_code}, content={resp.content}")
+        logger.debug(
+            "Response status=%d, content_length=%d",
+            resp.status_code,
+            len(resp.content),
+        )
         return resp
 
+    def has_capacity(self) -> bool:
+        return (
+            time.time() > self.last_time + self.time_step
+            and self.in_flight < self.max_in_flight
+        )
+
     async def call(
         self, method: str, url: str, *args, **kwargs
     ) -> tuple[ServiceManagerStatus, httpx.Response | None]:
-        # note: this lock is not thread safe
-        # should be fine with a single threaded event loop
-        cur_time = time.time()
-        if cur_time > self.last_time + self.time_step and not self.lock.locked():
-            async with self.lock:
-                res = await self._make_request(method=method, url=url, *args, **kwargs)
-                self.last_time = time.time()
-                if res is None:
-                    return ServiceManagerStatus.BUSY, None
-                return ServiceManagerStatus.ACK, res
-
-        return ServiceManagerStatus.BUSY, None
+        # note: this is not thread safe
+        # should be fine with a single threaded event loop, as there is no
+        # await between checking capacity and reserving the slot
+        if not self.has_capacity():
+            return ServiceManagerStatus.BUSY, None
+
+        self.last_time = time.time()
+        self.in_flight += 1
+        try:
+            res = await self._make_request(method=method, url=url, *args, **kwargs)
+        finally:
+            self.in_flight -= 1
+        if res is None:
+            return ServiceManagerStatus.BUSY, None
+        return ServiceManagerStatus.ACK, res
 
     async def cleanup(self):
-        await self.client.aclose()
+        if self._owns_client:
+            await self.client.aclose()
@@ -0,0 +1,255 @@
+import itertools
+import os
+import sqlite3
+import time
+from collections import defaultdict
+from collections.abc import Generator, Iterable
+from contextlib import closing, contextmanager
+from functools import reduce
+from operator import add
+
+import persistqueue
+from persistqueue.sqlackqueue import AckStatus
+
+from app.enums import SignTaskStatus
+from app.queue import AbstractQueue
+from app.schemas import IntSignTask, QueueStats
+
+# sqlite auto_vacuum mode which lets free pages be released in steps
+AUTO_VACUUM_INCREMENTAL = 2
+WAL_SIZE_LIMIT_BYTES = 1024 * 1024
+
+
+class PersistentQueue(AbstractQueue):
+
+    def __init__(
+        self,
+        db_path: str,
+        multithreading: bool = False,
+        synchronous: str = "NORMAL",
+    ):
+        """synchronous: sqlite synchronous level, with WAL NORMAL can lose
+        the last commits on power loss but never corrupts the database
+        """
+        # unacked tasks are requeued by recover(), rather than on every open
+        self.queue = persistqueue.SQLiteAckQueue(
+            db_path,
+            auto_commit=True,
+            multithreading=multithreading,
+            auto_resume=False,
+        )
+        self.db_file = os.path.join(self.queue.path, self.queue.db_file_name)
+        conn = self.queue._putter
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+            # only takes effect after a full VACUUM, a one off on an existing
+            # file. That file grew without limit, purge it first so the VACUUM
+            # only rewrites the live rows, rather than holding up startup
+            self._purge_acked(conn)
+            conn.execute(f"PRAGMA auto_vacuum={AUTO_VACUUM_INCREMENTAL}")
+            conn.execute("VACUUM")
+        for conn in {self.queue._putter, self.queue._getter}:
+            conn.execute(f"PRAGMA synchronous={synchronous}")
+            # the WAL is truncated back to this size once checkpointed
+            conn.execute(f"PRAGMA journal_size_limit={WAL_SIZE_LIMIT_BYTES}")
+
+    def add(self, x: IntSignTask) -> None:
+        self.queue.put(x)
+
+    def add_many(self, xs: Iterable[IntSignTask]) -> None:
+        """Inserts every task in one transaction, rather than a commit each"""
+        queue = self.queue
+        now = time.time()
+        rows = [(queue._serializer.dumps(x), now) for x in xs]
+        if not rows:
+            return
+        with queue.tran_lock:
+            with queue._putter as conn:
+                conn.executemany(queue._sql_insert, rows)
+        queue.total += len(rows)
+        queue.put_event.set()
+
+    @contextmanager
+    def get(self) -> Generator[IntSignTask | None, None, None]:
+        row = None
+        if self.queue.qsize():
+            try:
+                # tasks already taken by another consumer are skipped,
+                # never block the event loop waiting for one
+                row = self.queue.get(block=False, raw=True)
+            except persistqueue.Empty:
+                pass
+        if row is None:
+            yield None
+            return
+        item = row["data"]
+        try:
+            yield item
+        finally:
+            if item.status == SignTaskStatus.PENDING:
+                self._requeue(row["pqid"], item)
+            else:
+                # failed tasks are kept by the dead letter store, so both are
+                # acked and purged by compact()
+                self.queue.ack(id=row["pqid"])
+
+    def _requeue(self, pqid: int, item: IntSignTask) -> None:
+        """Returns a task to the queue, writing back its retry count
+
+        nack() only resets the status, the row keeps the task as first added.
+        """
+        queue = self.queue
+        with queue.action_lock:
+            with queue.tran_lock:
+                with queue._putter as conn:
+                    conn.execute(
+                        f"UPDATE {queue._table_name} SET data = ?, status = ? "
+                        "WHERE _id = ?",
+                        (queue._serializer.dumps(item), AckStatus.ready, pqid),
+                    )
+            queue._unack_cache.pop(pqid, None)
+            queue.total += 1
+
+    def __len__(self) -> int:
+        return self.queue.active_size()
+
+    def recover(self) -> int:
+        """Requeues every unacked row in one UPDATE
+
+        Only this process uses the file, so on startup any task still taken
+        was left by a previous run that was killed mid task.
+        """
+        with self.queue.tran_lock:
+            with self.queue._putter as conn:
+                recovered = conn.execute(
+                    f"UPDATE {self.queue._table_name} SET status = ? WHERE status = ?",
+                    (AckStatus.ready, AckStatus.unack),
+                ).rowcount
+            self.queue.total += recovered
+        return recovered
+
+    def _purge_acked(
+        self,
+        conn: sqlite3.Connection,
+        batch_size: int = 1000,
+        max_batches: int | None = None,
+    ) -> int:
+        """Deletes acked rows, batch_size per transaction, returns how many"""
+        table = self.queue._table_name
+        purged = 0
+        batches = itertools.count() if max_batches is None else range(max_batches)
+        for _ in batches:
+            with conn:
+                deleted = conn.execute(
+                    f"DELETE FROM {table} WHERE _id IN "
+                    f"(SELECT _id FROM {table} WHERE status = ? LIMIT ?)",
+                    (AckStatus.acked, batch_size),
+                ).rowcount
+            purged += deleted
+            if deleted < batch_size:
+                break
+        return purged
+
+    def compact(self, batch_size: int = 1000, max_batches: int = 100) -> QueueStats:
+        """Purges acked rows in batches, then vacuums and checkpoints
+
+        Uses its own connection, so is safe to call from another thread while
+        the queue is in use. Each batch is its own short transaction so writers
+        on the event loop are never held up for long.
+        """
+        table = self.queue._table_name
+        with closing(sqlite3.connect(self.db_file, timeout=self.queue.timeout)) as conn:
+            purged = self._purge_acked(conn, batch_size, max_batches)
+            conn.execute(f"PRAGMA journal_size_limit={WAL_SIZE_LIMIT_BYTES}")
+            # execute() only steps the pragma once, ie. frees a single page
+            conn.executescript(f"PRAGMA incremental_vacuum({batch_size});")
+            # PASSIVE never waits on, or holds up, the event loop's connections
+            conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+            counts = dict(
+                conn.execute(f"SELECT status, COUNT(*) FROM {table} GROUP BY status")
+            )
+        wal_file = f"{self.db_file}-wal"
+        return QueueStats(
+            file_bytes=os.path.getsize(self.db_file),
+            wal_bytes=os.path.getsize(wal_file) if os.path.exists(wal_file) else 0,
+            ready=counts.get(int(AckStatus.inited), 0)
+            + counts.get(int(AckStatus.ready), 0),
+            unacked=counts.get(int(AckStatus.unack), 0),
+            acked=counts.get(int(AckStatus.acked), 0),
+            ack_failed=counts.get(int(AckStatus.ack_failed), 0),
+            purged=purged,
+        )
+
+
+class ShardedPersistentQueue(AbstractQueue):
+    """PersistentQueue split over num_shards SQLite files
+
+    Tasks are hashed to a shard by id, so writers only contend on the write
+    lock of one file rather than all sharing one. get() round robins over the
+    shards, so ordering is FIFO within a shard but only approximately overall.
+    len() is a counter kept by this instance, the shards are only scanned
+    once on startup.
+
+    Single process, like PersistentQueue: readiness and size are tracked by
+    the instance, and recover() requeues every task taken. Run one worker
+    per PERSISTENT_QUEUE_PATH, threads within it may share the instance.
+    Use the postgres queue to spread load over processes or replicas.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        num_shards: int = 4,
+        multithreading: bool = False,
+        synchronous: str = "NORMAL",
+    ):
+        self.shards = [
+            PersistentQueue(
+                os.path.join(db_path, f"shard-{i}"),
+                multithreading=multithreading,
+                synchronous=synchronous,
+            )
+            for i in range(num_shards)
+        ]
+        self._size = sum(len(shard) for shard in self.shards)
+        self._next_shard = 0
+
+    def _shard_index(self, x: IntSignTask) -> int:
+        return x.id.int % len(self.shards)
+
+    def add(self, x: IntSignTask) -> None:
+        self.shards[self._shard_index(x)].add(x)
+        self._size += 1
+
+    def add_many(self, xs: Iterable[IntSignTask]) -> None:
+        by_shard = defaultdict(list)
+        for x in xs:
+            by_shard[self._shard_index(x)].append(x)
+        for index, shard_xs in by_shard.items():
+            self.shards[index].add_many(shard_xs)
+            self._size += len(shard_xs)
+
+    @contextmanager
+    def get(self) -> Generator[IntSignTask | None, None, None]:
+        num_shards = len(self.shards)
+        for offset in range(num_shards):
+            index = (self._next_shard + offset) % num_shards
+            with self.shards[index].get() as item:
+                if item is None:
+                    continue
+                self._next_shard = (index + 1) % num_shards
+                yield item
+                if item.status != SignTaskStatus.PENDING:
+                    self._size -= 1
+                return
+        yield None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def recover(self) -> int:
+        recovered = sum(shard.recover() for shard in self.shards)
+        self._size += recovered
+        return recovered
+
+    def compact(self, batch_size: int = 1000) -> QueueStats:
+        return reduce(add, (shard.compact(batch_size) for shard in self.shards))
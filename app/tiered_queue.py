@@ -0,0 +1,164 @@
+import glob
+import os
+import sys
+from collections import deque
+from collections.abc import Generator
+from contextlib import contextmanager
+
+from app.enums import SignTaskStatus
+from app.queue import AbstractQueue
+from app.schemas import IntSignTask
+
+
+class CompactTask:
+    """Slot based copy of an IntSignTask, without pydantic's per instance state"""
+
+    __slots__ = tuple(IntSignTask.model_fields)
+
+    @classmethod
+    def from_task(cls, task: IntSignTask) -> "CompactTask":
+        compact = cls()
+        for name in cls.__slots__:
+            setattr(compact, name, getattr(task, name))
+        return compact
+
+    def to_task(self) -> IntSignTask:
+        # values came from a validated task, no need to validate again
+        return IntSignTask.model_construct(
+            **{name: getattr(self, name) for name in self.__slots__}
+        )
+
+    def size(self) -> int:
+        """Approximate bytes held, strings dominate"""
+        return sys.getsizeof(self) + sum(
+            sys.getsizeof(value)
+            for value in (getattr(self, name) for name in self.__slots__)
+            if isinstance(value, str)
+        )
+
+
+class Segment:
+    """One spill file, appended to until it holds segment_tasks tasks"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.writer = open(path, "ab")
+        self.reader = None
+        self.written = 0
+        self.read = 0
+
+    def close(self) -> None:
+        for f in (self.reader, self.writer):
+            if f is not None:
+                f.close()
+        self.reader = None
+        self.writer = None
+
+
+class TieredQueue(AbstractQueue):
+    """In memory queue which spills to disk past a memory watermark
+
+    The head of the queue is held in memory as CompactTasks. Once they take
+    more than max_memory_bytes, newly added tasks are appended to segment
+    files instead, and paged back in, oldest first, when the in memory tier has
+    drained to half the watermark, PAGE_IN_TASKS per get() so refilling never
+    parses a whole watermark of tasks on the event loop at once. Each segment holds up to segment_tasks
+    tasks and is deleted once fully paged in, so disk use follows the backlog.
+    Segments only exist to save memory, they're discarded on startup, so like
+    InMemoryQueue tasks don't survive a restart.
+    """
+
+    SEGMENT_FILE_GLOB = "tiered_queue*.seg"
+    PAGE_IN_TASKS = 256
+
+    def __init__(
+        self,
+        spill_path: str,
+        max_memory_bytes: int = 64 * 1024 * 1024,
+        segment_tasks: int = 10_000,
+    ):
+        self.max_memory_bytes = max_memory_bytes
+        self.segment_tasks = segment_tasks
+        # head of the queue on the right, like InMemoryQueue
+        self.hot: deque[CompactTask] = deque([])
+        self.hot_bytes = 0
+        os.makedirs(spill_path, exist_ok=True)
+        self.spill_path = spill_path
+        for path in glob.glob(os.path.join(spill_path, self.SEGMENT_FILE_GLOB)):
+            os.remove(path)
+        # oldest on the left, tasks are only ever appended to the newest
+        self.segments: deque[Segment] = deque([])
+        self._next_segment = 0
+        self.cold_count = 0
+
+    def _push_hot(self, compact: CompactTask, head: bool = False) -> None:
+        if head:
+            self.hot.append(compact)
+        else:
+            self.hot.appendleft(compact)
+        self.hot_bytes += compact.size()
+
+    def _pop_hot(self) -> CompactTask:
+        compact = self.hot.pop()
+        self.hot_bytes -= compact.size()
+        return compact
+
+    def _spill(self, x: IntSignTask) -> None:
+        if not self.segments or self.segments[-1].written >= self.segment_tasks:
+            if self.segments:
+                # rotated, it's only read from now on
+                self.segments[-1].writer.close()
+                self.segments[-1].writer = None
+            path = os.path.join(
+                self.spill_path, f"tiered_queue.{self._next_segment:08d}.seg"
+            )
+            self._next_segment += 1
+            self.segments.append(Segment(path))
+        tail = self.segments[-1]
+        tail.writer.write(x.model_dump_json().encode() + b"\n")
+        tail.written += 1
+        self.cold_count += 1
+
+    def _page_in(self) -> None:
+        for _ in range(self.PAGE_IN_TASKS):
+            if not self.cold_count or self.hot_bytes >= self.max_memory_bytes:
+                return
+            head = self.segments[0]
+            if head.writer is not None:
+                # still the newest, so flush what was appended since last read
+                head.writer.flush()
+            if head.reader is None:
+                head.reader = open(head.path, "rb")
+            line = head.reader.readline()
+            self._push_hot(CompactTask.from_task(IntSignTask.model_validate_json(line)))
+            head.read += 1
+            self.cold_count -= 1
+            if head.read == head.written:
+                head.close()
+                os.remove(head.path)
+                self.segments.popleft()
+
+    def add(self, x: IntSignTask) -> None:
+        compact = CompactTask.from_task(x)
+        # once anything is on disk, new tasks must queue behind it
+        if self.cold_count or self.hot_bytes + compact.size() > self.max_memory_bytes:
+            self._spill(x)
+        else:
+            self._push_hot(compact)
+
+    @contextmanager
+    def get(self) -> Generator[IntSignTask | None, None, None]:
+        if self.cold_count and self.hot_bytes < self.max_memory_bytes // 2:
+            self._page_in()
+        if len(self.hot):
+            item = self._pop_hot().to_task()
+            try:
+                yield item
+            finally:
+                if item.status == SignTaskStatus.PENDING:
+                    self._push_hot(CompactTask.from_task(item), head=True)
+        else:
+            yield None
+
+    def __len__(self) -> int:
+        return len(self.hot) + self.cold_count
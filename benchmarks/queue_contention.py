@@ -0,0 +1,124 @@
+"""Write lock contention of the single file vs sharded SQLite queue
+
+Producer threads enqueue while consumer threads dequeue and ack, all in one
+process with one queue instance, as the app uses it. The SQLite queues are
+single process, see ShardedPersistentQueue. Reports throughput, and the
+latency of an enqueue and of a dequeue plus its ack, both dominated by
+waiting on the SQLite write lock.
+
+Run with
+```
+python -m benchmarks.queue_contention --dir /var/lib/sqlite/data
+```
+the directory should be on the same kind of disk as production, commit
+latency and so lock hold time depend on fsync.
+"""
+
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+from uuid import uuid4
+
+from app.enums import SignTaskStatus
+from app.schemas import IntSignTask
+from app.sqlite_queue import PersistentQueue, ShardedPersistentQueue
+
+NUM_PRODUCERS = 2
+NUM_CONSUMERS = 2
+TASKS_PER_PRODUCER = 500
+NUM_SHARDS = 4
+
+
+def open_queue(kind: str, path: str):
+    if kind == "sharded":
+        return ShardedPersistentQueue(path, num_shards=NUM_SHARDS, multithreading=True)
+    return PersistentQueue(path, multithreading=True)
+
+
+def produce(queue, start_barrier, latencies: list[float]) -> None:
+    start_barrier.wait()
+    for i in range(TASKS_PER_PRODUCER):
+        task = IntSignTask(
+            webhook_url="https://example.com/webhook",
+            message=f"message {i}",
+            id=uuid4(),
+            status=SignTaskStatus.PENDING,
+        )
+        start = time.perf_counter()
+        queue.add(task)
+        latencies.append(time.perf_counter() - start)
+
+
+def consume(queue, start_barrier, remaining, latencies: list[float]) -> None:
+    start_barrier.wait()
+    while True:
+        with remaining["lock"]:
+            if remaining["tasks"] == 0:
+                return
+        start = time.perf_counter()
+        with queue.get() as task:
+            if task is None:
+                # caught up with the producers
+                time.sleep(0.0001)
+                continue
+            task.mark_done()
+        latencies.append(time.perf_counter() - start)
+        with remaining["lock"]:
+            remaining["tasks"] -= 1
+
+
+def summary(name: str, latencies: list[float], elapsed: float) -> str:
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99)]
+    return (
+        f"{name} {len(latencies) / elapsed:6.0f}/s "
+        f"median {statistics.median(latencies) * 1e3:5.2f} ms "
+        f"p99 {p99 * 1e3:5.2f} ms"
+    )
+
+
+def run(kind: str, base_dir: str | None) -> None:
+    with tempfile.TemporaryDirectory(dir=base_dir) as tmpdir:
+        # opening a queue writes to it, keep that out of the measurement
+        queue = open_queue(kind, tmpdir)
+        start_barrier = threading.Barrier(NUM_PRODUCERS + NUM_CONSUMERS + 1)
+        remaining = {
+            "lock": threading.Lock(),
+            "tasks": NUM_PRODUCERS * TASKS_PER_PRODUCER,
+        }
+        enqueued: list[float] = []
+        dequeued: list[float] = []
+        threads = [
+            threading.Thread(target=produce, args=(queue, start_barrier, enqueued))
+            for _ in range(NUM_PRODUCERS)
+        ] + [
+            threading.Thread(
+                target=consume, args=(queue, start_barrier, remaining, dequeued)
+            )
+            for _ in range(NUM_CONSUMERS)
+        ]
+        for thread in threads:
+            thread.start()
+        start_barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    print(
+        f"{kind:>8}: {summary('enqueue', enqueued, elapsed)}, "
+        f"{summary('dequeue', dequeued, elapsed)}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dir", default=None, help="where to create the queues")
+    args = parser.parse_args()
+    for kind in ("single", "sharded"):
+        run(kind, args.dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Memory held per pending task by the in memory queue backends
+
+Run with
+```
+python -m benchmarks.queue_memory
+```
+"""
+
+import tempfile
+import tracemalloc
+from uuid import uuid4
+
+from app.enums import SignTaskStatus
+from app.queue import InMemoryQueue
+from app.schemas import IntSignTask
+from app.tiered_queue import TieredQueue
+
+NUM_TASKS = 20000
+
+
+def make_task(i: int) -> IntSignTask:
+    return IntSignTask(
+        webhook_url=f"https://example.com/webhook/{i}",
+        message=f"message to sign {i}",
+        id=uuid4(),
+        status=SignTaskStatus.PENDING,
+    )
+
+
+def measure(name: str, queue) -> None:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(NUM_TASKS):
+        queue.add(make_task(i))
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{name:>28}: {(after - before) / NUM_TASKS:8.1f} bytes/task")
+
+
+def main():
+    measure("InMemoryQueue (deque)", InMemoryQueue())
+    with tempfile.TemporaryDirectory() as tmpdir:
+        measure("TieredQueue (all in memory)", TieredQueue(tmpdir))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        measure("TieredQueue (1MB watermark)", TieredQueue(tmpdir, 1024 * 1024))
+
+
+if __name__ == "__main__":
+    main()
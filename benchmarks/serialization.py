@@ -0,0 +1,55 @@
+"""Per-request serialization cost of a SignTask response
+
+Compares the previous path, sanitize() followed by FastAPI's response_model
+validation and JSON encoding, against encoding the internal task directly.
+
+Run with
+```
+python -m benchmarks.serialization
+```
+"""
+
+import json
+import timeit
+from uuid import uuid4
+
+from fastapi.encoders import jsonable_encoder
+
+from app.enums import SignTaskStatus
+from app.schemas import IntSignTask, SignTask
+
+NUMBER = 20000
+
+
+def make_task() -> IntSignTask:
+    return IntSignTask(
+        id=uuid4(),
+        webhook_url="https://example.com/webhook",
+        message="foobar" * 10,
+        status=SignTaskStatus.SUCCESS,
+        signature="YWFhYQ==" * 40,
+        num_retries=2,
+    )
+
+
+def sanitize_and_validate(task: IntSignTask) -> bytes:
+    # mirrors crypto_sign returning task.sanitize() with response_model=SignTask
+    public = task.sanitize()
+    validated = SignTask.model_validate(public.model_dump())
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def direct(task: IntSignTask) -> bytes:
+    return task.to_json_bytes()
+
+
+def main():
+    task = make_task()
+    assert json.loads(sanitize_and_validate(task)) == json.loads(direct(task))
+    for fn in (sanitize_and_validate, direct):
+        best = min(timeit.repeat(lambda: fn(task), number=NUMBER, repeat=5))
+        print(f"{fn.__name__:>24}: {best / NUMBER * 1e6:8.2f} us/request")
+
+
+if __name__ == "__main__":
+    main()
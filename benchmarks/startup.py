@@ -0,0 +1,104 @@
+"""Import time of the app and time until the first 200 from a fresh server
+
+Each run starts a new interpreter, so nothing is cached between runs. Time to
+first 200 is measured from process start until GET /health answers, covering
+imports, the lifespan opening the queue and uvicorn binding the port.
+
+Run with
+```
+python -m benchmarks.startup --queue-type persistent
+```
+Pass --max-first-200 to exit non-zero when the median goes over a budget,
+eg. as a regression guard in CI.
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+RUNS = 5
+POLL_INTERVAL = 0.01
+START_TIMEOUT = 30.0
+
+
+def import_time() -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import app.main"], check=True)
+    return time.perf_counter() - start
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_200(env: dict[str, str]) -> float:
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        env=env,
+    )
+    try:
+        while time.perf_counter() - start < START_TIMEOUT:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                    return time.perf_counter() - start
+            except httpx.TransportError:
+                pass
+            if server.poll() is not None:
+                raise RuntimeError(f"server exited with {server.returncode}")
+            time.sleep(POLL_INTERVAL)
+        raise TimeoutError(f"no 200 within {START_TIMEOUT}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queue-type", default="persistent")
+    parser.add_argument("--runs", type=int, default=RUNS)
+    parser.add_argument(
+        "--max-first-200", type=float, default=None, help="budget in seconds"
+    )
+    args = parser.parse_args()
+
+    imports = [import_time() for _ in range(args.runs)]
+    print(f"import app.main       median {statistics.median(imports) * 1000:8.1f}ms")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        env = {
+            **os.environ,
+            "QUEUE_TYPE": args.queue_type,
+            "PERSISTENT_QUEUE_PATH": tmpdir,
+            "LOG_LEVEL": "WARNING",
+        }
+        first_200 = [time_to_first_200(env) for _ in range(args.runs)]
+    median = statistics.median(first_200)
+    print(f"time to first 200     median {median * 1000:8.1f}ms")
+
+    if args.max_first_200 is not None and median > args.max_first_200:
+        print(f"over budget of {args.max_first_200 * 1000:.1f}ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
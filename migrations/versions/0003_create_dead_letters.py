@@ -0,0 +1,50 @@
+"""create dead_letters
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "dead_letters",
+        sa.Column("task_id", sa.Uuid(), nullable=False),
+        sa.Column("task", postgresql.JSONB(), nullable=False),
+        sa.Column("reason", sa.String(32), nullable=False),
+        sa.Column("last_status_code", sa.Integer(), nullable=True),
+        sa.Column("first_failed_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("last_failed_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("failures", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("task_id"),
+    )
+    op.create_index(
+        "ix_dead_letters_last_failed_at", "dead_letters", ["last_failed_at"]
+    )
+    op.create_index(
+        "ix_dead_letters_reason", "dead_letters", ["reason", "last_failed_at"]
+    )
+    op.create_index(
+        "ix_dead_letters_last_status_code",
+        "dead_letters",
+        ["last_status_code", "last_failed_at"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_dead_letters_last_status_code", table_name="dead_letters")
+    op.drop_index("ix_dead_letters_reason", table_name="dead_letters")
+    op.drop_index("ix_dead_letters_last_failed_at", table_name="dead_letters")
+    op.drop_table("dead_letters")
@@ -2,6 +2,11 @@
 
 
 run_app() {
+    if [ "$QUEUE_TYPE" = "postgres" ]; then
+        # safe to run from every replica, migrations/env.py holds a postgres
+        # advisory lock while migrating so only one replica applies them
+        poetry run alembic upgrade head
+    fi
     # runs on port 8000 by default
     exec poetry run fastapi run app/main.py
 }
@@ -1,16 +1,13 @@
-# import psycopg
 import pytest
 from fastapi.testclient import TestClient
 
-# from pytest_mock import MockerFixture
-# from sqlalchemy import create_engine
+from app.blob_store import InMemoryBlobStore
+from app.config import AppConfig
+from app.enums import ServiceManagerStatus
+from app.idempotency import InMemoryIdempotencyIndex
+from app.queue import InMemoryQueue
 
-
-# def create_test_sync_engine(postgresql: psycopg.Connection, echo: bool = True):
-#     return create_engine(
-#         f"postgresql://{postgresql.info.user}:@{postgresql.info.host}:{postgresql.info.port}/{postgresql.info.dbname}",
-#         echo=echo,
-#     )
+from .manager_fixture import get_mocked_manager
 
 
 @pytest.fixture(scope="function")
@@ -20,7 +17,22 @@ def client():
     return TestClient(app)
 
 
-# @pytest.fixture
-# def alembic_engine(postgresql: psycopg.Connection):
-#     """Override this fixture to provide pytest-alembic powered tests with a database handle."""
-#     return create_test_sync_engine(postgresql)
+@pytest.fixture(scope="function")
+def busy_app(client):
+    """client of an app with in memory state, whose upstream is always busy
+    so every sign request is queued
+    """
+    app = client.app
+    app.state.cfg = AppConfig(
+        API_KEY="",
+        UNRELIABLE_SERVICE_URL="foo.com",
+        LOG_LEVEL="DEBUG",
+        QUEUE_TYPE="in_memory",
+        SIGN_MAX_MESSAGE_BYTES=1000,
+        BLOB_THRESHOLD_BYTES=10,
+    )
+    app.state.queue = InMemoryQueue()
+    app.state.idempotency = InMemoryIdempotencyIndex()
+    app.state.blobs = InMemoryBlobStore()
+    app.state.manager = get_mocked_manager(response=(ServiceManagerStatus.BUSY, None))
+    return client
@@ -30,7 +30,7 @@ def get_mocked_manager(
     """
     manager = MagicMock()
 
-    async def mock_call(method, url):
+    async def mock_call(method, url, **kwargs):
         return response
 
     manager.call = AsyncMock(side_effect=mock_call)
@@ -0,0 +1,38 @@
+import glob
+import shutil
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine
+
+# pytest-postgresql launches a throwaway postgres server with pg_ctl
+requires_postgres = pytest.mark.skipif(
+    shutil.which("pg_ctl") is None
+    and not glob.glob("/usr/lib/postgresql/*/bin/pg_ctl"),
+    reason="postgres server binaries not installed",
+)
+
+
+def create_test_sync_engine(postgresql, echo: bool = False):
+    return create_engine(
+        f"postgresql+psycopg2://{postgresql.info.user}:@{postgresql.info.host}:{postgresql.info.port}/{postgresql.info.dbname}",
+        echo=echo,
+    )
+
+
+@pytest.fixture
+def alembic_engine(postgresql):
+    """Override this fixture to provide pytest-alembic powered tests with a database handle."""
+    return create_test_sync_engine(postgresql)
+
+
+@pytest.fixture
+def postgres_engine(alembic_engine):
+    """Engine for a fresh database migrated to head"""
+    cfg = Config("alembic.ini")
+    with alembic_engine.begin() as connection:
+        cfg.attributes["connection"] = connection
+        command.upgrade(cfg, "head")
+    yield alembic_engine
+    alembic_engine.dispose()
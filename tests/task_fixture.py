@@ -0,0 +1,17 @@
+from uuid import uuid4
+
+from app.enums import SignTaskStatus
+from app.schemas.messages import IntSignTask
+
+
+def make_task(i: int = 1, **fields) -> IntSignTask:
+    """A pending task numbered i, fields override its defaults"""
+    return IntSignTask(
+        **{
+            "webhook_url": f"foo.foo.foo.{i}",
+            "message": f"foobar{i}",
+            "id": uuid4(),
+            "status": SignTaskStatus.PENDING,
+            **fields,
+        }
+    )
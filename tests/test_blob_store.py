@@ -0,0 +1,59 @@
+import tempfile
+
+from app.blob_store import (
+    InMemoryBlobStore,
+    SQLiteBlobStore,
+    TieredBlobStore,
+    blob_digest,
+    blob_store_factory,
+)
+from app.config import AppConfig
+
+
+def check_store(store):
+    data = b"foobar" * 1000
+    digest = store.put(data)
+    assert digest == blob_digest(data)
+    assert store.get(digest) == data
+    assert store.get(blob_digest(b"other")) is None
+
+    # identical payloads are stored once, and kept until the last release
+    assert store.put(data) == digest
+    store.release(digest)
+    assert store.get(digest) == data
+    store.release(digest)
+    assert store.get(digest) is None
+
+    # releasing an unknown digest is a no-op
+    store.release(digest)
+
+
+def test_in_memory_blob_store():
+    check_store(InMemoryBlobStore())
+
+
+def test_sqlite_blob_store():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        check_store(SQLiteBlobStore(tmpdir))
+
+        # survives a restart
+        digest = SQLiteBlobStore(tmpdir).put(b"foobar")
+        assert SQLiteBlobStore(tmpdir).get(digest) == b"foobar"
+
+
+def test_tiered_blob_store():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cfg = AppConfig(
+            API_KEY="",
+            UNRELIABLE_SERVICE_URL="foo.com",
+            LOG_LEVEL="DEBUG",
+            QUEUE_TYPE="tiered",
+            PERSISTENT_QUEUE_PATH=tmpdir,
+        )
+        store = blob_store_factory(cfg)
+        assert isinstance(store, TieredBlobStore)
+        check_store(store)
+
+        # emptied on startup, as the tiered queue is
+        digest = store.put(b"foobar")
+        assert TieredBlobStore(tmpdir).get(digest) is None
@@ -1,6 +1,11 @@
+import json
 from uuid import uuid4
 
+import httpx
+import pytest
+
 from app.enums import SignTaskStatus
+from app.main import call_webhook
 from app.schemas.messages import IntSignTask
 
 from .client_fixture import client
@@ -21,3 +26,31 @@ def test_call_webhook_success(client):
         "/crypto/test-webhook", json=t1.sanitize().model_dump(mode="json")
     )
     assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_call_webhook_encoded_bytes():
+    """The webhook posts pre-encoded bytes rather than a dumped dict"""
+
+    t1 = IntSignTask(
+        webhook_url="http://webhook.test/hook",
+        message="foobar1",
+        id=uuid4(),
+        status=SignTaskStatus.SUCCESS,
+        signature="YWFhYQ==",
+        num_retries=3,
+    )
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        return httpx.Response(200)
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as webhook:
+        await call_webhook(t1, webhook)
+
+    assert len(seen) == 1
+    assert seen[0].url == "http://webhook.test/hook"
+    assert seen[0].headers["Content-Type"] == "application/json"
+    assert seen[0].content == t1.to_json_bytes()
+    assert json.loads(seen[0].content) == t1.sanitize().model_dump(mode="json")
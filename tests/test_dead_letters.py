@@ -0,0 +1,194 @@
+import asyncio
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+import pytest
+
+from app.config import AppConfig
+from app.dead_letters import (
+    InMemoryDeadLetterStore,
+    SQLiteDeadLetterStore,
+    replay_dead_letters,
+)
+from app.enums import DeadLetterReason, ServiceManagerStatus, SignTaskStatus
+from app.idempotency import InMemoryIdempotencyIndex
+from app.queue import InMemoryQueue
+from app.schemas import DeadLetterFilter, ReplayProgress
+from app.schemas.messages import IntSignTask
+
+from .client_fixture import client
+from .manager_fixture import get_mocked_manager
+
+EVERYTHING = DeadLetterFilter()
+
+
+def make_failed_task(num: int = 1) -> IntSignTask:
+    return IntSignTask(
+        webhook_url=f"foo.foo.foo.{num}",
+        message=f"foobar{num}",
+        id=uuid4(),
+        status=SignTaskStatus.FAIL,
+        num_retries=5,
+    )
+
+
+def check_store(store):
+    t1, t2 = make_failed_task(1), make_failed_task(2)
+    store.add(t1, DeadLetterReason.MAX_RETRIES, 500)
+    between = datetime.now(timezone.utc)
+    time.sleep(0.01)
+    store.add(t2, DeadLetterReason.MAX_RETRIES, 429)
+
+    letters = store.find(EVERYTHING)
+    assert [letter.task for letter in letters] == [t1, t2]
+    assert letters[0].last_status_code == 500
+    assert letters[0].failures == 1
+    assert store.count(EVERYTHING) == 2
+
+    assert store.find(DeadLetterFilter(status_code=429))[0].task == t2
+    assert store.find(DeadLetterFilter(since=between))[0].task == t2
+    assert store.find(DeadLetterFilter(until=between))[0].task == t1
+    assert store.count(DeadLetterFilter(reason=DeadLetterReason.MAX_RETRIES)) == 2
+    assert len(store.find(EVERYTHING, limit=1)) == 1
+
+    # failing again after a replay keeps the first failure time
+    store.add(t1, DeadLetterReason.MAX_RETRIES, 503)
+    letters = store.find(EVERYTHING)
+    assert letters[-1].task == t1
+    assert letters[-1].failures == 2
+    assert letters[-1].last_status_code == 503
+    assert letters[-1].first_failed_at < letters[-1].last_failed_at
+
+    assert store.delete([t1.id, t2.id]) == 2
+    assert store.count(EVERYTHING) == 0
+
+
+def test_in_memory_dead_letter_store():
+    check_store(InMemoryDeadLetterStore())
+
+
+def test_sqlite_dead_letter_store():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        check_store(SQLiteDeadLetterStore(tmpdir))
+
+        # survives a restart
+        task = make_failed_task()
+        SQLiteDeadLetterStore(tmpdir).add(task, DeadLetterReason.MAX_RETRIES, 500)
+        assert SQLiteDeadLetterStore(tmpdir).find(EVERYTHING)[0].task == task
+
+
+@pytest.mark.asyncio
+async def test_replay_dead_letters_in_paced_batches():
+    store = InMemoryDeadLetterStore()
+    queue = InMemoryQueue()
+    for num in range(5):
+        store.add(make_failed_task(num), DeadLetterReason.MAX_RETRIES, 500)
+    progress = ReplayProgress(matched=5, started_at=datetime.now(timezone.utc))
+
+    start = time.perf_counter()
+    await replay_dead_letters(
+        store, queue, EVERYTHING, progress, batch_size=2, pace=0.01
+    )
+    # a sleep of batch length * pace after each of the 3 batches
+    assert time.perf_counter() - start >= 0.05
+
+    assert progress.replayed == 5
+    assert not progress.running
+    assert store.count(EVERYTHING) == 0
+    assert len(queue) == 5
+    with queue.get() as task:
+        assert task.status == SignTaskStatus.PENDING
+        assert task.num_retries == 0
+
+
+@pytest.mark.asyncio
+async def test_replay_skips_tasks_which_fail_again():
+    store = InMemoryDeadLetterStore()
+    task = make_failed_task()
+    store.add(task, DeadLetterReason.MAX_RETRIES, 500)
+    progress = ReplayProgress(
+        matched=1, started_at=datetime.now(timezone.utc) + timedelta(seconds=1)
+    )
+
+    class FailingAgainQueue(InMemoryQueue):
+        def add_many(self, xs):
+            super().add_many(xs)
+            store.add(task, DeadLetterReason.MAX_RETRIES, 500)
+
+    await asyncio.wait_for(
+        replay_dead_letters(store, FailingAgainQueue(), EVERYTHING, progress), 1
+    )
+    assert progress.replayed == 1
+
+
+@pytest.fixture(scope="function")
+def dead_letter_client(client):
+    client.app.state.cfg = AppConfig(
+        API_KEY="",
+        UNRELIABLE_SERVICE_URL="foo.com",
+        LOG_LEVEL="DEBUG",
+        QUEUE_TYPE="in_memory",
+        ADMIN_API_KEY="admin-secret",
+    )
+    client.app.state.queue = InMemoryQueue()
+    client.app.state.dead_letters = InMemoryDeadLetterStore()
+    client.app.state.manager = get_mocked_manager(
+        response=(ServiceManagerStatus.BUSY, None)
+    )
+    client.app.state.replay_task = None
+    client.app.state.replay_progress = None
+    return client
+
+
+def test_admin_dead_letters_list_and_replay(dead_letter_client):
+    headers = {"X-Admin-Key": "admin-secret"}
+    store = dead_letter_client.app.state.dead_letters
+    store.add(make_failed_task(1), DeadLetterReason.MAX_RETRIES, 500)
+    store.add(make_failed_task(2), DeadLetterReason.MAX_RETRIES, 429)
+
+    response = dead_letter_client.get(
+        "/admin/dead-letters", params={"status_code": 429}, headers=headers
+    )
+    assert response.status_code == 200
+    assert response.json()["total"] == 1
+    assert response.json()["items"][0]["task"]["message"] == "foobar2"
+    assert response.json()["items"][0]["reason"] == "MAX_RETRIES"
+
+    response = dead_letter_client.post(
+        "/admin/dead-letters/replay", params={"status_code": 429}, headers=headers
+    )
+    assert response.status_code == 202
+    assert response.json()["matched"] == 1
+
+    for _ in range(100):
+        response = dead_letter_client.get("/admin/dead-letters/replay", headers=headers)
+        if not response.json()["running"]:
+            break
+        time.sleep(0.01)
+    assert response.json()["replayed"] == 1
+    assert not response.json()["running"]
+    assert len(dead_letter_client.app.state.queue) == 1
+    assert store.count(EVERYTHING) == 1
+
+
+@pytest.mark.asyncio
+async def test_on_task_failure_dead_letters_and_updates_idempotency_key():
+    from app.main import on_task_failure
+
+    store = InMemoryDeadLetterStore()
+    idempotency = InMemoryIdempotencyIndex()
+    task = make_failed_task()
+    task.idempotency_key = "key-1"
+
+    await on_task_failure(
+        task,
+        DeadLetterReason.MAX_RETRIES,
+        500,
+        dead_letters=store,
+        idempotency=idempotency,
+    )
+
+    assert store.find(EVERYTHING)[0].last_status_code == 500
+    assert idempotency.get("key-1").status == SignTaskStatus.FAIL
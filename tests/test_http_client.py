@@ -0,0 +1,57 @@
+import httpx
+import pytest
+
+from app.config import AppConfig
+from app.http_client import HttpClients
+
+
+def get_test_config(**kwargs) -> AppConfig:
+    return AppConfig(
+        API_KEY="secret",
+        UNRELIABLE_SERVICE_URL="https://upstream.test",
+        LOG_LEVEL="DEBUG",
+        QUEUE_TYPE="in_memory",
+        **kwargs,
+    )
+
+
+@pytest.mark.asyncio
+async def test_upstream_client_config():
+    cfg = get_test_config(UPSTREAM_CONNECT_TIMEOUT=1.5, UPSTREAM_READ_TIMEOUT=4.0)
+    clients = HttpClients(cfg)
+
+    assert clients.upstream.headers["Authorization"] == "secret"
+    assert clients.upstream.timeout.connect == 1.5
+    assert clients.upstream.timeout.read == 4.0
+    assert "Authorization" not in clients.webhook.headers
+
+    await clients.aclose()
+
+
+@pytest.mark.asyncio
+async def test_warm_up():
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        return httpx.Response(200)
+
+    clients = HttpClients(get_test_config(), transport=httpx.MockTransport(handler))
+
+    assert await clients.warm_up()
+    assert seen[0].method == "HEAD"
+    assert seen[0].headers["Authorization"] == "secret"
+
+    await clients.aclose()
+
+
+@pytest.mark.asyncio
+async def test_warm_up_failure_is_not_fatal():
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError("refused", request=request)
+
+    clients = HttpClients(get_test_config(), transport=httpx.MockTransport(handler))
+
+    assert not await clients.warm_up()
+
+    await clients.aclose()
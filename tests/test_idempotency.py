@@ -0,0 +1,139 @@
+import tempfile
+import time
+
+import pytest
+
+from app.enums import SignTaskStatus
+from app.idempotency import InMemoryIdempotencyIndex, SQLiteIdempotencyIndex
+
+from .client_fixture import busy_app, client
+from .task_fixture import make_task
+
+
+def check_index(index):
+    task = make_task(idempotency_key="key-1")
+    assert index.get("key-1") is None
+
+    assert index.claim("key-1", task) is None
+    assert index.get("key-1") == task
+    # a second claim is handed the task of the first
+    assert index.claim("key-1", make_task(idempotency_key="key-1")) == task
+
+    task.mark_done()
+    task.signature = "YWFhYQ=="
+    index.put("key-1", task)
+    assert index.get("key-1").status == SignTaskStatus.SUCCESS
+    assert index.get("key-1").signature == "YWFhYQ=="
+
+    index.delete("key-1")
+    assert index.get("key-1") is None
+
+
+def check_expired_key_is_reclaimed(index):
+    """index has a ttl of 0.2s"""
+    index.put("key-1", make_task(idempotency_key="key-1"))
+    time.sleep(0.25)
+    # not swept yet, putting it again starts a new ttl
+    index.put("key-1", make_task(idempotency_key="key-1"))
+    assert index.get("key-1") is not None
+
+    time.sleep(0.25)
+    task = make_task(idempotency_key="key-1")
+    assert index.claim("key-1", task) is None
+    assert index.get("key-1") == task
+
+
+def test_in_memory_idempotency_index():
+    check_index(InMemoryIdempotencyIndex())
+
+
+def test_in_memory_idempotency_index_expiry():
+    index = InMemoryIdempotencyIndex(ttl=0)
+    index.put("key-1", make_task(idempotency_key="key-1"))
+    assert index.get("key-1") is None
+
+    # expired keys are swept on put
+    index.put("key-2", make_task(idempotency_key="key-1"))
+    assert "key-1" not in index.index
+
+    check_expired_key_is_reclaimed(InMemoryIdempotencyIndex(ttl=0.2))
+
+
+def test_sqlite_idempotency_index():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        check_index(SQLiteIdempotencyIndex(tmpdir))
+
+        # survives a restart
+        SQLiteIdempotencyIndex(tmpdir).put("key-2", make_task(idempotency_key="key-1"))
+        assert SQLiteIdempotencyIndex(tmpdir).get("key-2") is not None
+
+
+def test_sqlite_idempotency_index_expiry():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        index = SQLiteIdempotencyIndex(tmpdir, ttl=0)
+        index.put("key-1", make_task(idempotency_key="key-1"))
+        assert index.get("key-1") is None
+
+        check_expired_key_is_reclaimed(SQLiteIdempotencyIndex(tmpdir, ttl=0.2))
+
+
+def test_crypto_sign_idempotency_key(busy_app):
+    params = {
+        "message": "foobar1",
+        "webhook_url": "http://localhost:8000/crypto/test-webhook",
+    }
+    headers = {"Idempotency-Key": "key-1"}
+
+    first = busy_app.get("/crypto/sign", params=params, headers=headers)
+    second = busy_app.get("/crypto/sign", params=params, headers=headers)
+
+    assert first.status_code == 202
+    assert second.status_code == 202
+    assert second.json() == first.json()
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert busy_app.app.state.manager.call.call_count == 1
+    assert len(busy_app.app.state.queue) == 1
+
+    # once signed the retry gets the signature
+    with busy_app.app.state.queue.get() as task:
+        task.mark_done()
+        task.signature = "YWFhYQ=="
+        busy_app.app.state.idempotency.put(task.idempotency_key, task)
+
+    third = busy_app.get("/crypto/sign", params=params, headers=headers)
+    assert third.status_code == 200
+    assert third.json()["signature"] == "YWFhYQ=="
+    assert busy_app.app.state.manager.call.call_count == 1
+
+    # a different key is a new task
+    other = busy_app.get(
+        "/crypto/sign", params=params, headers={"Idempotency-Key": "2"}
+    )
+    assert other.json()["id"] != first.json()["id"]
+    assert len(busy_app.app.state.queue) == 1
+
+
+def test_crypto_sign_releases_the_key_when_the_request_fails(busy_app):
+    headers = {"Idempotency-Key": "key-1"}
+    # the lookup of a hostname label over 63 characters raises UnicodeError
+    bad = {"message": "foobar1", "webhook_url": f"http://{'a' * 70}.com/hook"}
+    with pytest.raises(UnicodeError):
+        busy_app.get("/crypto/sign", params=bad, headers=headers)
+    assert busy_app.app.state.idempotency.get("key-1") is None
+
+    # a retry is queued, rather than replaying a task that was never queued
+    params = {
+        "message": "foobar1",
+        "webhook_url": "http://localhost:8000/crypto/test-webhook",
+    }
+    retry = busy_app.get("/crypto/sign", params=params, headers=headers)
+    assert retry.status_code == 202
+    assert "Idempotent-Replayed" not in retry.headers
+    assert len(busy_app.app.state.queue) == 1
+
+
+def test_crypto_sign_releases_the_blob_when_the_request_fails(busy_app):
+    bad = {"message": "foobar" * 10, "webhook_url": f"http://{'a' * 70}.com/hook"}
+    with pytest.raises(UnicodeError):
+        busy_app.get("/crypto/sign", params=bad, headers={"Idempotency-Key": "key-1"})
+    assert busy_app.app.state.blobs.blobs == {}
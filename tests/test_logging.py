@@ -0,0 +1,41 @@
+import json
+import logging
+
+from app.logging import JsonFormatter, ThrottleFilter
+
+
+def make_record(msg: str, *args, throttle: bool = False) -> logging.LogRecord:
+    record = logging.LogRecord(
+        "reliable_api_service.test", logging.DEBUG, __file__, 1, msg, args, None
+    )
+    if throttle:
+        record.throttle = True
+    return record
+
+
+def test_throttle_filter():
+    throttle = ThrottleFilter(interval=60.0)
+
+    assert throttle.filter(make_record("queue_len=%d", 1, throttle=True))
+    assert not throttle.filter(make_record("queue_len=%d", 2, throttle=True))
+    assert not throttle.filter(make_record("queue_len=%d", 3, throttle=True))
+    # other messages and unthrottled records are unaffected
+    assert throttle.filter(make_record("other=%d", 1, throttle=True))
+    assert throttle.filter(make_record("queue_len=%d", 4))
+
+    throttle.interval = 0.0
+    record = make_record("queue_len=%d", 5, throttle=True)
+    assert throttle.filter(record)
+    assert record.suppressed == 2
+
+
+def test_json_formatter():
+    record = make_record("queue_len=%d", 7)
+    record.suppressed = 3
+
+    payload = json.loads(JsonFormatter().format(record))
+
+    assert payload["message"] == "queue_len=7"
+    assert payload["level"] == "DEBUG"
+    assert payload["logger"] == "reliable_api_service.test"
+    assert payload["suppressed"] == 3
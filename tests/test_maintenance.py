@@ -0,0 +1,113 @@
+import asyncio
+import os
+import tempfile
+
+import persistqueue
+import pytest
+
+from app.maintenance import queue_maintenance
+from app.queue import InMemoryQueue
+from app.sqlite_queue import PersistentQueue, ShardedPersistentQueue
+
+from .task_fixture import make_task
+
+
+def fill(queue, num_done: int, num_failed: int, num_pending: int):
+    queue.add_many(
+        make_task(i, message=f"foobar{i}" * 100)
+        for i in range(num_done + num_failed + num_pending)
+    )
+    for _ in range(num_done):
+        with queue.get() as top:
+            top.mark_done()
+    for _ in range(num_failed):
+        with queue.get() as top:
+            top.mark_failed()
+
+
+def test_persistent_queue_pragmas():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        queue = PersistentQueue(tmpdir)
+        conn = queue.queue._putter
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        # NORMAL
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+
+
+def test_persistent_queue_purges_before_switching_auto_vacuum():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # a file from before auto_vacuum, full of acked rows
+        old = persistqueue.SQLiteAckQueue(tmpdir, auto_commit=True)
+        for i in range(30):
+            old.put(make_task(i))
+        for _ in range(28):
+            old.ack(old.get(block=False))
+        old._putter.close()
+        old._getter.close()
+
+        queue = PersistentQueue(tmpdir)
+        conn = queue.queue._putter
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        stats = queue.compact()
+        assert stats.purged == 0
+        assert stats.acked == 0
+        assert stats.ready == 2
+
+
+def test_persistent_queue_compact():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        queue = PersistentQueue(tmpdir)
+        fill(queue, num_done=250, num_failed=3, num_pending=2)
+        # add_many is one commit, below the auto checkpoint, move it to the file
+        queue.queue._putter.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        size_before = os.path.getsize(queue.db_file)
+
+        stats = queue.compact(batch_size=100)
+
+        # failed tasks live on in the dead letter store
+        assert stats.purged == 253
+        assert stats.acked == 0
+        assert stats.ack_failed == 0
+        assert stats.ready == 2
+        assert stats.file_bytes < size_before
+        assert stats.file_bytes == os.path.getsize(queue.db_file)
+
+        # the queue is unaffected
+        assert len(queue) == 2
+        with queue.get() as top:
+            assert top is not None
+
+
+def test_sharded_persistent_queue_compact():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        queue = ShardedPersistentQueue(tmpdir, num_shards=3)
+        fill(queue, num_done=20, num_failed=0, num_pending=4)
+
+        stats = queue.compact()
+
+        assert stats.purged == 20
+        assert stats.ready == 4
+
+
+@pytest.mark.asyncio
+async def test_queue_maintenance_runs_in_background():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        queue = PersistentQueue(tmpdir, multithreading=True)
+        fill(queue, num_done=10, num_failed=0, num_pending=1)
+        reports = []
+
+        task = asyncio.create_task(
+            queue_maintenance(queue, interval=0.01, on_stats=reports.append)
+        )
+        await asyncio.sleep(0.25)
+        task.cancel()
+
+        assert reports[0].purged == 10
+        assert reports[-1].purged == 0
+        assert reports[-1].ready == 1
+
+
+@pytest.mark.asyncio
+async def test_queue_maintenance_stops_without_storage():
+    await asyncio.wait_for(queue_maintenance(InMemoryQueue(), interval=0.01), 1)
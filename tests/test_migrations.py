@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+import sqlalchemy as sa
+from pytest_alembic.tests import (
+    test_model_definitions_match_ddl,
+    test_single_head_revision,
+    test_up_down_consistency,
+    test_upgrade,
+)
+
+from .postgres_fixture import alembic_engine, requires_postgres
+
+pytestmark = requires_postgres
+
+
+def test_concurrent_upgrades_wait_for_each_other(alembic_engine):
+    # alembic's context is process global, so each replica is a process
+    env = {
+        **os.environ,
+        "DATABASE_URL": alembic_engine.url.render_as_string(hide_password=False),
+    }
+    replicas = [
+        subprocess.Popen(
+            [sys.executable, "-m", "alembic", "upgrade", "head"],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        for _ in range(4)
+    ]
+    for replica in replicas:
+        _, stderr = replica.communicate(timeout=60)
+        assert replica.returncode == 0, stderr.decode()
+
+    with alembic_engine.connect() as connection:
+        version = connection.execute(sa.text("SELECT version_num FROM alembic_version"))
+        assert version.scalar_one() == "0004"
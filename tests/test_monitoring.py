@@ -0,0 +1,101 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.config import AppConfig
+from app.monitoring import LoopLagMonitor, sample_profile
+
+from .client_fixture import client
+
+
+def blocking_call():
+    time.sleep(0.3)
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor_captures_blocking_stack():
+    monitor = LoopLagMonitor(interval=0.01, stall_threshold=0.05)
+    task = asyncio.create_task(monitor.run())
+    await asyncio.sleep(0.1)
+
+    blocking_call()
+    await asyncio.sleep(0.1)
+    task.cancel()
+
+    report = monitor.report()
+    assert report.samples > 5
+    assert sum(report.counts) == report.samples
+    assert report.max_lag >= 0.25
+    assert len(report.stalls) == 1
+    assert any("blocking_call" in line for line in report.stalls[0].stack)
+
+
+def test_sample_profile():
+    stop = threading.Event()
+
+    def busy_worker():
+        while not stop.is_set():
+            sum(range(1000))
+
+    worker = threading.Thread(target=busy_worker, name="busy")
+    worker.start()
+    try:
+        profile = sample_profile(0.1, interval=0.001)
+    finally:
+        stop.set()
+        worker.join()
+
+    lines = profile.splitlines()
+    assert lines
+    busy = [line for line in lines if line.startswith("busy;")]
+    assert busy
+    stack, count = busy[0].rsplit(" ", 1)
+    assert "busy_worker" in stack
+    assert int(count) > 0
+
+
+@pytest.fixture(scope="function")
+def admin_client(client):
+    client.app.state.cfg = AppConfig(
+        API_KEY="",
+        UNRELIABLE_SERVICE_URL="foo.com",
+        LOG_LEVEL="DEBUG",
+        QUEUE_TYPE="in_memory",
+        ADMIN_API_KEY="admin-secret",
+    )
+    client.app.state.loop_monitor = LoopLagMonitor()
+    client.app.state.queue_stats = None
+    return client
+
+
+def test_admin_requires_key(admin_client):
+    assert admin_client.get("/admin/loop-lag").status_code == 401
+    response = admin_client.get("/admin/loop-lag", headers={"X-Admin-Key": "wrong"})
+    assert response.status_code == 401
+
+    admin_client.app.state.cfg.ADMIN_API_KEY = ""
+    response = admin_client.get(
+        "/admin/loop-lag", headers={"X-Admin-Key": "admin-secret"}
+    )
+    assert response.status_code == 404
+
+
+def test_admin_loop_lag_and_profile(admin_client):
+    headers = {"X-Admin-Key": "admin-secret"}
+
+    response = admin_client.get("/admin/loop-lag", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["samples"] == 0
+
+    response = admin_client.get(
+        "/admin/profile", params={"seconds": 0.05}, headers=headers
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+
+    response = admin_client.get(
+        "/admin/profile", params={"seconds": 3600}, headers=headers
+    )
+    assert response.status_code == 422
@@ -0,0 +1,10 @@
+from app.postgres_blob_store import PostgresBlobStore
+
+from .postgres_fixture import alembic_engine, postgres_engine, requires_postgres
+from .test_blob_store import check_store
+
+pytestmark = requires_postgres
+
+
+def test_postgres_blob_store(postgres_engine):
+    check_store(PostgresBlobStore(postgres_engine))
@@ -0,0 +1,52 @@
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock
+
+import httpx
+import pytest
+
+from app.dead_letters import replay_dead_letters
+from app.enums import ServiceManagerStatus
+from app.postgres_dead_letters import PostgresDeadLetterStore
+from app.postgres_queue import PostgresQueue
+from app.queue_handler import process_task
+from app.schemas import ReplayProgress
+
+from .manager_fixture import get_mocked_manager
+from .postgres_fixture import alembic_engine, postgres_engine, requires_postgres
+from .test_dead_letters import EVERYTHING, check_store, make_failed_task
+
+pytestmark = requires_postgres
+
+
+def test_postgres_dead_letter_store(postgres_engine):
+    check_store(PostgresDeadLetterStore(postgres_engine))
+
+
+@pytest.mark.asyncio
+async def test_replay_into_postgres_queue(postgres_engine):
+    queue = PostgresQueue(postgres_engine)
+    store = PostgresDeadLetterStore(postgres_engine)
+    task = make_failed_task()
+    task.reset()
+    queue.add(task)
+
+    async def on_failure(task, reason, last_status_code):
+        await store.run(store.add, task, reason, last_status_code)
+
+    manager = get_mocked_manager(
+        response=(ServiceManagerStatus.ACK, httpx.Response(status_code=500))
+    )
+    await process_task(
+        "foo.com", queue, manager, AsyncMock(), max_retries=1, on_failure=on_failure
+    )
+    assert store.count(EVERYTHING) == 1
+    assert len(queue) == 0
+
+    # the task goes back under its own id
+    progress = ReplayProgress(matched=1, started_at=datetime.now(timezone.utc))
+    await replay_dead_letters(store, queue, EVERYTHING, progress)
+    assert progress.replayed == 1
+    assert store.count(EVERYTHING) == 0
+    with queue.get() as replayed:
+        assert replayed.id == task.id
+        assert replayed.num_retries == 0
@@ -0,0 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from app.postgres_idempotency import PostgresIdempotencyIndex
+
+from .postgres_fixture import alembic_engine, postgres_engine, requires_postgres
+from .task_fixture import make_task
+from .test_idempotency import check_expired_key_is_reclaimed, check_index
+
+pytestmark = requires_postgres
+
+
+def test_postgres_idempotency_index(postgres_engine):
+    check_index(PostgresIdempotencyIndex(postgres_engine))
+
+
+def test_postgres_idempotency_index_expiry(postgres_engine):
+    index = PostgresIdempotencyIndex(postgres_engine, ttl=0)
+    index.put("key-1", make_task(idempotency_key="key-1"))
+    assert index.get("key-1") is None
+
+    check_expired_key_is_reclaimed(PostgresIdempotencyIndex(postgres_engine, ttl=0.2))
+
+
+def test_postgres_idempotency_claim_is_atomic(postgres_engine):
+    index = PostgresIdempotencyIndex(postgres_engine)
+    tasks = [make_task(idempotency_key="key-1") for _ in range(8)]
+    with ThreadPoolExecutor(max_workers=len(tasks)) as pool:
+        claims = list(pool.map(lambda task: index.claim("key-1", task), tasks))
+
+    # one claim wins, every other is handed its task
+    winners = [task for task, existing in zip(tasks, claims) if existing is None]
+    assert len(winners) == 1
+    assert all(existing in (None, winners[0]) for existing in claims)
@@ -0,0 +1,97 @@
+import pytest
+
+from app.postgres_queue import PostgresQueue
+
+from .postgres_fixture import alembic_engine, postgres_engine, requires_postgres
+from .task_fixture import make_task
+
+pytestmark = requires_postgres
+
+
+def test_postgres_queue(postgres_engine):
+    queue = PostgresQueue(postgres_engine)
+
+    t1 = make_task(1)
+    t2 = make_task(2)
+
+    queue.add(t1)
+    queue.add(t2)
+
+    assert len(queue) == 2
+    with queue.get() as top:
+        assert top.id == t1.id
+        top.inc_retries()
+
+    assert len(queue) == 2
+    with queue.get() as top:
+        assert top.id == t1.id
+        assert top.num_retries == 1
+        top.mark_done()
+
+    assert len(queue) == 1
+    with queue.get() as top:
+        top.mark_failed()
+        assert top.id == t2.id
+
+    # exhaust
+    assert len(queue) == 0
+    with queue.get() as top:
+        assert top is None
+
+
+def test_postgres_queue_concurrent_consumers_skip_leased(postgres_engine):
+    replica_a = PostgresQueue(postgres_engine)
+    replica_b = PostgresQueue(postgres_engine)
+
+    tasks = [make_task(i) for i in range(3)]
+    replica_a.add_many(tasks)
+
+    with replica_a.get() as first:
+        with replica_b.get() as second:
+            assert first.id == tasks[0].id
+            assert second.id == tasks[1].id
+            second.mark_done()
+        first.mark_done()
+
+    with replica_b.get() as third:
+        assert third.id == tasks[2].id
+        third.mark_done()
+
+    assert len(replica_a) == 0
+
+
+def test_postgres_queue_expired_lease_is_redelivered(postgres_engine):
+    queue = PostgresQueue(postgres_engine, lease_seconds=0)
+    t1 = make_task(1)
+    queue.add(t1)
+
+    # simulate a consumer which died holding the lease
+    assert queue._lease().id == t1.id
+
+    with queue.get() as top:
+        assert top.id == t1.id
+
+
+def test_postgres_queue_expired_lease_is_ready_again(postgres_engine):
+    queue = PostgresQueue(postgres_engine, lease_seconds=0)
+    t1 = make_task(1)
+    queue.add(t1)
+    # leased and never released, as if the replica crashed
+    assert queue._lease() is not None
+
+    # nothing to recover, the expired lease already makes it ready
+    assert queue.recover() == 0
+    with queue.get() as top:
+        assert top.id == t1.id
+
+
+@pytest.mark.asyncio
+async def test_postgres_queue_from_the_loop(postgres_engine):
+    queue = PostgresQueue(postgres_engine)
+    t1 = make_task(1)
+    await queue.run(queue.add, t1)
+
+    async with queue.aget() as top:
+        assert top.id == t1.id
+        top.mark_done()
+    assert await queue.run(len, queue) == 0
@@ -1,9 +1,13 @@
 import tempfile
+import threading
 from uuid import uuid4
 
+import pytest
+
 from app.enums import SignTaskStatus
-from app.queue import InMemoryQueue, PersistentQueue
+from app.queue import InMemoryQueue
 from app.schemas.messages import IntSignTask
+from app.sqlite_queue import PersistentQueue, ShardedPersistentQueue
 
 
 def test_in_memory_queue():
@@ -84,3 +88,160 @@ def test_persistent_queue():
         assert len(queue) == 0
         with queue.get() as top:
             assert top is None
+
+
+def test_in_memory_queue_concurrent_gets():
+
+    queue = InMemoryQueue()
+
+    t1 = IntSignTask(
+        webhook_url="foo.foo.foo.1",
+        message="foobar1",
+        id=uuid4(),
+        status=SignTaskStatus.PENDING,
+    )
+    t2 = IntSignTask(
+        webhook_url="foo.foo.foo.2",
+        message="foobar2",
+        id=uuid4(),
+        status=SignTaskStatus.PENDING,
+    )
+    queue.add(t1)
+    queue.add(t2)
+
+    with queue.get() as first:
+        with queue.get() as second:
+            with queue.get() as third:
+                assert third is None
+            assert second.id == t2.id
+            second.mark_done()
+        assert first.id == t1.id
+
+    # pending task returns to the head
+    assert len(queue) == 1
+    with queue.get() as top:
+        assert top.id == t1.id
+
+
+def test_persistent_queue_concurrent_gets():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        queue = PersistentQueue(tmpdir)
+
+        t1 = IntSignTask(
+            webhook_url="foo.foo.foo.1",
+            message="foobar1",
+            id=uuid4(),
+            status=SignTaskStatus.PENDING,
+        )
+        queue.add(t1)
+
+        with queue.get() as first:
+            # must not block while the only task is taken
+            with queue.get() as second:
+                assert second is None
+            assert first.id == t1.id
+
+        assert len(queue) == 1
+
+
+def test_sharded_persistent_queue():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        queue = ShardedPersistentQueue(tmpdir, num_shards=3)
+
+        tasks = [
+            IntSignTask(
+                webhook_url=f"foo.foo.foo.{i}",
+                message=f"foobar{i}",
+                id=uuid4(),
+                status=SignTaskStatus.PENDING,
+            )
+            for i in range(10)
+        ]
+        queue.add_many(tasks[:5])
+        for t in tasks[5:]:
+            queue.add(t)
+
+        assert len(queue) == 10
+        with queue.get() as top:
+            top.inc_retries()
+        assert len(queue) == 10
+
+        seen = set()
+        while len(queue):
+            with queue.get() as top:
+                seen.add(top.id)
+                top.mark_done()
+
+        assert seen == {t.id for t in tasks}
+        with queue.get() as top:
+            assert top is None
+
+        # counter is rebuilt from the shards on restart
+        queue.add(tasks[0])
+        assert len(ShardedPersistentQueue(tmpdir, num_shards=3)) == 1
+
+
+def test_persistent_queue_recovers_unacked_tasks():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        queue = PersistentQueue(tmpdir)
+        t1 = IntSignTask(
+            webhook_url="foo.foo.foo.1",
+            message="foobar1",
+            id=uuid4(),
+            status=SignTaskStatus.PENDING,
+        )
+        queue.add(t1)
+        # taken but never acked or nacked, as if killed mid task
+        queue.queue.get(block=False)
+
+        restarted = PersistentQueue(tmpdir)
+        assert len(restarted) == 0
+        assert restarted.recover() == 1
+        assert len(restarted) == 1
+        with restarted.get() as top:
+            assert top.id == t1.id
+        assert restarted.recover() == 0
+
+
+def test_sharded_persistent_queue_recovers_unacked_tasks():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        queue = ShardedPersistentQueue(tmpdir, num_shards=3)
+        queue.add_many(
+            IntSignTask(
+                webhook_url=f"foo.foo.foo.{i}",
+                message=f"foobar{i}",
+                id=uuid4(),
+                status=SignTaskStatus.PENDING,
+            )
+            for i in range(6)
+        )
+        for shard in queue.shards:
+            if shard.queue.qsize():
+                shard.queue.get(block=False)
+
+        restarted = ShardedPersistentQueue(tmpdir, num_shards=3)
+        recovered = restarted.recover()
+        assert recovered > 0
+        assert len(restarted) == 6
+
+
+@pytest.mark.asyncio
+async def test_queue_calls_from_the_loop():
+    queue = InMemoryQueue()
+    t1 = IntSignTask(
+        webhook_url="foo.foo.foo.1",
+        message="foobar1",
+        id=uuid4(),
+        status=SignTaskStatus.PENDING,
+    )
+    # local backends are called inline
+    assert await queue.run(threading.get_ident) == threading.get_ident()
+    await queue.run(queue.add, t1)
+    async with queue.aget() as top:
+        assert top.id == t1.id
+        top.mark_done()
+    assert await queue.run(len, queue) == 0
+
+    # networked ones in a worker thread
+    queue.in_thread = True
+    assert await queue.run(threading.get_ident) != threading.get_ident()
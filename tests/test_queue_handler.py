@@ -1,16 +1,20 @@
 import asyncio
 import base64
 import copy
-from unittest.mock import AsyncMock
+import tempfile
+from unittest.mock import AsyncMock, patch
 from uuid import uuid4
 
 import httpx
 import pytest
 
-from app.enums import ServiceManagerStatus, SignTaskStatus
+from app.blob_store import InMemoryBlobStore
+from app.enums import DeadLetterReason, ServiceManagerStatus, SignTaskStatus
 from app.main import queue_handler
 from app.queue import InMemoryQueue
+from app.queue_handler import process_task
 from app.schemas.messages import IntSignTask
+from app.sqlite_queue import PersistentQueue
 
 from .manager_fixture import get_mocked_manager
 
@@ -195,11 +199,7 @@ async def test_queue_handler_ack_but_bad_status():
     task.cancel()
 
 
-@pytest.mark.asyncio
-async def test_queue_handler_max_retries():
-
-    queue = InMemoryQueue()
-
+async def check_max_retries(queue):
     manager = get_mocked_manager(
         response=(
             ServiceManagerStatus.ACK,
@@ -227,12 +227,286 @@ async def test_queue_handler_max_retries():
     queue.add(t2)
     assert len(queue) == 2
 
+    on_failure = AsyncMock()
+
     task = asyncio.create_task(
-        queue_handler("foo.com", queue, manager, on_success, max_retries)
+        queue_handler(
+            "foo.com", queue, manager, on_success, max_retries, on_failure=on_failure
+        )
     )
 
     await asyncio.sleep(0.25)
     assert on_success.call_count == 0
     assert len(queue) == 0
+    # both handed over to be dead lettered with the last status code
+    assert on_failure.call_count == 2
+    assert {call.args[0].id for call in on_failure.call_args_list} == {t1.id, t2.id}
+    assert all(
+        call.args[1:] == (DeadLetterReason.MAX_RETRIES, 500)
+        for call in on_failure.call_args_list
+    )
+
+    task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_queue_handler_max_retries():
+    await check_max_retries(InMemoryQueue())
+
+
+@pytest.mark.asyncio
+async def test_queue_handler_max_retries_persistent_queue():
+    # the retry count must survive the task being returned to the file
+    with tempfile.TemporaryDirectory() as tmpdir:
+        await check_max_retries(PersistentQueue(tmpdir))
+
+
+@pytest.mark.asyncio
+async def test_queue_handler_dispatches_without_waiting_for_response():
+
+    queue = InMemoryQueue()
+    release = asyncio.Event()
+    manager = get_mocked_manager()
+
+    async def slow_call(method, url, **kwargs):
+        await release.wait()
+        return (
+            ServiceManagerStatus.ACK,
+            httpx.Response(status_code=200, content=b"aaaa"),
+        )
+
+    manager.call = AsyncMock(side_effect=slow_call)
+    on_success = AsyncMock()
+
+    tasks = [
+        IntSignTask(
+            webhook_url=f"foo.foo.foo.{i}",
+            message=f"foobar{i}",
+            id=uuid4(),
+            status=SignTaskStatus.PENDING,
+        )
+        for i in range(3)
+    ]
+    for t in tasks:
+        queue.add(t)
+
+    task = asyncio.create_task(
+        queue_handler("foo.com", queue, manager, on_success, HIGH_RETRIES, 2)
+    )
+    await asyncio.sleep(0.25)
+
+    # two calls overlap, the third waits for a free slot
+    assert manager.call.call_count == 2
+    assert on_success.call_count == 0
+    assert len(queue) == 1
+
+    release.set()
+    await asyncio.sleep(0.25)
+
+    assert manager.call.call_count == 3
+    assert sorted(c[0][0].id for c in on_success.call_args_list) == sorted(
+        t.id for t in tasks
+    )
+    assert len(queue) == 0
 
     task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_queue_handler_drains_in_flight_tasks_on_stop():
+
+    queue = InMemoryQueue()
+    release = asyncio.Event()
+    manager = get_mocked_manager()
+
+    async def slow_call(method, url, **kwargs):
+        await release.wait()
+        return (
+            ServiceManagerStatus.ACK,
+            httpx.Response(status_code=200, content=b"aaaa"),
+        )
+
+    manager.call = AsyncMock(side_effect=slow_call)
+    on_success = AsyncMock()
+    for i in range(2):
+        queue.add(
+            IntSignTask(
+                webhook_url=f"foo.foo.foo.{i}",
+                message=f"foobar{i}",
+                id=uuid4(),
+                status=SignTaskStatus.PENDING,
+            )
+        )
+
+    stop = asyncio.Event()
+    task = asyncio.create_task(
+        queue_handler("foo.com", queue, manager, on_success, HIGH_RETRIES, 1, stop=stop)
+    )
+    await asyncio.sleep(0.05)
+    assert manager.call.call_count == 1
+
+    stop.set()
+    await asyncio.sleep(0.05)
+    # waits on the in flight task, no new ones are taken
+    assert not task.done()
+    release.set()
+    await asyncio.wait_for(task, 1)
+
+    assert on_success.call_count == 1
+    assert manager.call.call_count == 1
+    assert len(queue) == 1
+
+
+@pytest.mark.asyncio
+async def test_queue_handler_requeues_tasks_past_the_drain_timeout():
+
+    queue = InMemoryQueue()
+    manager = get_mocked_manager()
+
+    async def hung_call(method, url, **kwargs):
+        await asyncio.Event().wait()
+
+    manager.call = AsyncMock(side_effect=hung_call)
+    on_success = AsyncMock()
+    t1 = IntSignTask(
+        webhook_url="foo.foo.foo.1",
+        message="foobar1",
+        id=uuid4(),
+        status=SignTaskStatus.PENDING,
+    )
+    queue.add(t1)
+
+    stop = asyncio.Event()
+    task = asyncio.create_task(
+        queue_handler(
+            "foo.com",
+            queue,
+            manager,
+            on_success,
+            HIGH_RETRIES,
+            stop=stop,
+            drain_timeout=0.05,
+        )
+    )
+    await asyncio.sleep(0.05)
+    assert len(queue) == 0
+
+    stop.set()
+    await asyncio.wait_for(task, 1)
+
+    assert on_success.call_count == 0
+    assert len(queue) == 1
+    with queue.get() as top:
+        assert top.id == t1.id
+
+
+@pytest.mark.asyncio
+async def test_queue_handler_requeues_tasks_whose_webhook_is_cut_off():
+
+    queue = InMemoryQueue()
+    manager = get_mocked_manager()
+
+    async def hung_webhook(task):
+        await asyncio.Event().wait()
+
+    on_success = AsyncMock(side_effect=hung_webhook)
+    t1 = IntSignTask(
+        webhook_url="foo.foo.foo.1",
+        message="foobar1",
+        id=uuid4(),
+        status=SignTaskStatus.PENDING,
+    )
+    queue.add(t1)
+
+    stop = asyncio.Event()
+    task = asyncio.create_task(
+        queue_handler(
+            "foo.com",
+            queue,
+            manager,
+            on_success,
+            HIGH_RETRIES,
+            stop=stop,
+            drain_timeout=0.05,
+        )
+    )
+    await asyncio.sleep(0.05)
+    assert on_success.call_args[0][0].status == SignTaskStatus.SUCCESS
+
+    stop.set()
+    await asyncio.wait_for(task, 1)
+
+    # signed again and redelivered on the next start
+    assert len(queue) == 1
+    with queue.get() as top:
+        assert top.id == t1.id
+        assert top.status == SignTaskStatus.PENDING
+
+
+@pytest.mark.asyncio
+async def test_process_task_reads_message_from_blob_store():
+
+    queue = InMemoryQueue()
+    blobs = InMemoryBlobStore()
+    manager = get_mocked_manager()
+    on_success = AsyncMock()
+    on_failure = AsyncMock()
+
+    stored = IntSignTask(
+        webhook_url="foo.foo.foo.1",
+        message_digest=blobs.put(b"foobar" * 100),
+        id=uuid4(),
+        status=SignTaskStatus.PENDING,
+    )
+    missing = IntSignTask(
+        webhook_url="foo.foo.foo.2",
+        message_digest="0" * 64,
+        id=uuid4(),
+        status=SignTaskStatus.PENDING,
+    )
+    queue.add(stored)
+    queue.add(missing)
+
+    await process_task("foo.com", queue, manager, on_success, blobs=blobs)
+    assert manager.call.call_args.kwargs["params"] == {"message": "foobar" * 100}
+    assert on_success.call_args[0][0].id == stored.id
+
+    # can never be signed, so dead lettered without calling upstream
+    await process_task(
+        "foo.com", queue, manager, on_success, on_failure=on_failure, blobs=blobs
+    )
+    assert manager.call.call_count == 1
+    assert on_failure.call_args[0][0].id == missing.id
+    assert on_failure.call_args[0][1:] == (DeadLetterReason.MISSING_MESSAGE, None)
+    assert len(queue) == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_handler_logs_errors_of_processing_tasks():
+    queue = InMemoryQueue()
+    queue.add(
+        IntSignTask(
+            webhook_url="foo.foo.foo.1",
+            message="foobar1",
+            id=uuid4(),
+            status=SignTaskStatus.PENDING,
+        )
+    )
+    manager = get_mocked_manager(
+        response=(ServiceManagerStatus.ACK, httpx.Response(status_code=200))
+    )
+    error = RuntimeError("database is locked")
+    on_success = AsyncMock(side_effect=error)
+
+    stop = asyncio.Event()
+    with patch("app.queue_handler.logger") as logger:
+        task = asyncio.create_task(
+            queue_handler(
+                "foo.com", queue, manager, on_success, HIGH_RETRIES, stop=stop
+            )
+        )
+        await asyncio.sleep(0.05)
+        stop.set()
+        await asyncio.wait_for(task, 1)
+
+    assert logger.error.call_args.kwargs["exc_info"] is error
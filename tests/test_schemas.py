@@ -1,3 +1,4 @@
+import pickle
 from uuid import uuid4
 
 from app.enums import SignTaskStatus
@@ -24,3 +25,34 @@ def test_sanitize():
         status=SignTaskStatus.PENDING,
         signature="",
     )
+
+
+def test_to_json_bytes_matches_sanitize():
+
+    internal_task = IntSignTask(
+        id=uuid4(),
+        webhook_url="foo.com",
+        message="foobar",
+        status=SignTaskStatus.SUCCESS,
+        signature="YWFhYQ==",
+        num_retries=2,
+    )
+    payload = internal_task.to_json_bytes()
+
+    assert isinstance(payload, bytes)
+    assert b"num_retries" not in payload
+    assert SignTask.model_validate_json(payload) == internal_task.sanitize()
+
+
+def test_unpickle_task_from_an_older_release():
+    task = IntSignTask(id=uuid4(), status=SignTaskStatus.PENDING, message="foobar1")
+    state = task.__getstate__()
+    # as pickled before these fields existed
+    del state["__dict__"]["idempotency_key"]
+    del state["__dict__"]["message_digest"]
+
+    restored = IntSignTask.__new__(IntSignTask)
+    restored.__setstate__(state)
+    assert restored.message_digest == ""
+    assert restored.idempotency_key == ""
+    assert pickle.loads(pickle.dumps(task)) == task
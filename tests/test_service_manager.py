@@ -1,8 +1,11 @@
 import asyncio
+from unittest.mock import AsyncMock
 
+import httpx
 import pytest
 
 from app.enums import ServiceManagerStatus
+from app.service_manager import UnreliableServiceManager
 
 from .manager_fixture import triggered_test_manager
 
@@ -45,3 +48,36 @@ async def test_service_manager_bursts(triggered_test_manager):
     assert test_manager._make_request.call_count == 2
     assert first_result[0] == ServiceManagerStatus.ACK
     assert all([res[0] == ServiceManagerStatus.BUSY for res in results])
+
+
+@pytest.mark.asyncio
+async def test_service_manager_overlapping_calls():
+    manager = UnreliableServiceManager(max_requests_per_minute=600, max_in_flight=2)
+    trigger_make_request = asyncio.Event()
+
+    async def mocked_trigger(*args, **kwargs):
+        await trigger_make_request.wait()
+        return httpx.Response(status_code=200, content="good")
+
+    manager._make_request = AsyncMock(side_effect=mocked_trigger)
+
+    first_task = asyncio.create_task(manager.call("GET", url="foo.com"))
+    await asyncio.sleep(0)
+    # rate limited even though there is concurrency to spare
+    assert (await manager.call("GET", url="foo.com"))[0] == ServiceManagerStatus.BUSY
+
+    await asyncio.sleep(manager.time_step)
+    second_task = asyncio.create_task(manager.call("GET", url="foo.com"))
+    await asyncio.sleep(0)
+    assert manager.in_flight == 2
+
+    # allowed by the rate but both in flight slots are taken
+    await asyncio.sleep(manager.time_step)
+    assert (await manager.call("GET", url="foo.com"))[0] == ServiceManagerStatus.BUSY
+
+    trigger_make_request.set()
+    results = await asyncio.gather(first_task, second_task)
+
+    assert manager._make_request.call_count == 2
+    assert all([res[0] == ServiceManagerStatus.ACK for res in results])
+    assert manager.in_flight == 0
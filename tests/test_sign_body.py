@@ -0,0 +1,100 @@
+import gzip
+
+from .client_fixture import busy_app, client
+from .manager_fixture import get_mocked_manager
+
+WEBHOOK_URL = "http://localhost:8000/crypto/test-webhook"
+
+
+def test_message_is_passed_to_upstream_as_a_param(busy_app):
+    busy_app.get(
+        "/crypto/sign", params={"message": "a&b=c#d", "webhook_url": WEBHOOK_URL}
+    )
+
+    call = busy_app.app.state.manager.call.call_args
+    assert call.kwargs["url"] == "foo.com/crypto/sign"
+    assert call.kwargs["params"] == {"message": "a&b=c#d"}
+
+
+def test_post_body_is_queued_by_reference(busy_app):
+    message = "foobar" * 100
+    response = busy_app.post(
+        "/crypto/sign", params={"webhook_url": WEBHOOK_URL}, content=message
+    )
+    assert response.status_code == 202
+    assert response.json()["message"] == ""
+
+    assert busy_app.app.state.manager.call.call_args.kwargs["params"] == {
+        "message": message
+    }
+    with busy_app.app.state.queue.get() as task:
+        assert task.message == ""
+        assert busy_app.app.state.blobs.get(task.message_digest) == message.encode()
+
+
+def test_post_body_signed_straight_away_is_never_stored(busy_app):
+    busy_app.app.state.manager = get_mocked_manager()
+    response = busy_app.post(
+        "/crypto/sign", params={"webhook_url": WEBHOOK_URL}, content="foobar" * 100
+    )
+    assert response.status_code == 200
+    assert busy_app.app.state.blobs.blobs == {}
+    assert len(busy_app.app.state.queue) == 0
+
+
+def test_post_small_body_is_queued_inline(busy_app):
+    response = busy_app.post(
+        "/crypto/sign", params={"webhook_url": WEBHOOK_URL}, content="foobar1"
+    )
+    assert response.status_code == 202
+    assert response.json()["message"] == "foobar1"
+    assert busy_app.app.state.blobs.blobs == {}
+
+
+def test_post_gzip_body(busy_app):
+    message = "foobar" * 100
+    response = busy_app.post(
+        "/crypto/sign",
+        params={"webhook_url": WEBHOOK_URL},
+        content=gzip.compress(message.encode()),
+        headers={"Content-Encoding": "gzip"},
+    )
+    assert response.status_code == 202
+    assert busy_app.app.state.manager.call.call_args.kwargs["params"] == {
+        "message": message
+    }
+
+
+def test_post_body_limits(busy_app):
+    response = busy_app.post("/crypto/sign", content=b"a" * 1001)
+    assert response.status_code == 413
+
+    # a tiny gzip body which inflates past the limit
+    bomb = gzip.compress(b"a" * 100_000)
+    assert len(bomb) < 1000
+    response = busy_app.post(
+        "/crypto/sign", content=bomb, headers={"Content-Encoding": "gzip"}
+    )
+    assert response.status_code == 413
+
+    response = busy_app.post(
+        "/crypto/sign", content=b"not gzip", headers={"Content-Encoding": "gzip"}
+    )
+    assert response.status_code == 400
+
+    # junk after a valid gzip stream, in the same chunk or the ones after
+    member = gzip.compress(b"a")
+    for content in (member + b"junk", iter([member, b"junk" * 1000])):
+        response = busy_app.post(
+            "/crypto/sign", content=content, headers={"Content-Encoding": "gzip"}
+        )
+        assert response.status_code == 400
+
+    response = busy_app.post(
+        "/crypto/sign", content=b"aaaa", headers={"Content-Encoding": "br"}
+    )
+    assert response.status_code == 415
+
+    response = busy_app.post("/crypto/sign", content=b"\xff\xfe")
+    assert response.status_code == 422
+    assert busy_app.app.state.manager.call.call_count == 0
@@ -0,0 +1,62 @@
+import subprocess
+import sys
+import tempfile
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.enums import SignTaskStatus
+from app.env import get_app_config
+from app.schemas.messages import IntSignTask
+
+# only imported once their QUEUE_TYPE is selected
+BACKEND_MODULES = ("persistqueue", "sqlalchemy", "alembic", "psycopg2")
+
+
+def test_import_does_not_load_queue_backends():
+    # a fresh interpreter, this one already has them from other tests
+    out = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, app.main; "
+            f"print(','.join(m for m in {BACKEND_MODULES!r} if m in sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert out.stdout.strip() == ""
+
+
+@pytest.fixture
+def persistent_app(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setenv("QUEUE_TYPE", "persistent")
+        monkeypatch.setenv("PERSISTENT_QUEUE_PATH", tmpdir)
+        monkeypatch.setenv("UPSTREAM_WARM_UP", "false")
+        monkeypatch.setenv("LOOP_LAG_INTERVAL_SECONDS", "0")
+        monkeypatch.setenv("QUEUE_MAINTENANCE_INTERVAL_SECONDS", "0")
+        get_app_config.cache_clear()
+        from app.main import app
+
+        yield app
+    get_app_config.cache_clear()
+
+
+def test_stores_opened_in_threads_are_usable_from_the_loop(persistent_app):
+    task = IntSignTask(
+        webhook_url="foo.foo.foo.1",
+        message="foobar1",
+        id=uuid4(),
+        status=SignTaskStatus.PENDING,
+    )
+    with TestClient(persistent_app) as client:
+        assert client.get("/health").status_code == 200
+
+        # sqlite connections refuse other threads unless opened for it
+        client.portal.call(persistent_app.state.queue.add, task)
+        assert client.portal.call(len, persistent_app.state.queue) == 1
+        client.portal.call(persistent_app.state.idempotency.put, "key-1", task)
+        assert client.portal.call(persistent_app.state.idempotency.get, "key-1") == task
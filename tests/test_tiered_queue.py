@@ -0,0 +1,110 @@
+import glob
+import os
+import tempfile
+
+from app.tiered_queue import CompactTask, TieredQueue
+
+from .task_fixture import make_task
+
+
+def test_compact_task_round_trip():
+    task = make_task(1)
+    task.inc_retries()
+    assert CompactTask.from_task(task).to_task() == task
+
+
+def test_tiered_queue():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        queue = TieredQueue(tmpdir)
+
+        t1 = make_task(1)
+        t2 = make_task(2)
+        queue.add(t1)
+        queue.add(t2)
+
+        assert len(queue) == 2
+        with queue.get() as top:
+            assert top.id == t1.id
+            top.inc_retries()
+
+        assert len(queue) == 2
+        with queue.get() as top:
+            assert top.id == t1.id
+            assert top.num_retries == 1
+            top.mark_done()
+
+        assert len(queue) == 1
+        with queue.get() as top:
+            top.mark_failed()
+            assert top.id == t2.id
+
+        # exhaust
+        assert len(queue) == 0
+        with queue.get() as top:
+            assert top is None
+
+
+def segment_files(tmpdir: str) -> list[str]:
+    return sorted(glob.glob(os.path.join(tmpdir, TieredQueue.SEGMENT_FILE_GLOB)))
+
+
+def test_tiered_queue_spills_and_pages_in_order():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tasks = [make_task(i) for i in range(50)]
+        # room for only a few tasks in memory
+        task_size = CompactTask.from_task(tasks[0]).size()
+        queue = TieredQueue(tmpdir, max_memory_bytes=task_size * 4, segment_tasks=5)
+
+        for t in tasks[:25]:
+            queue.add(t)
+        assert len(queue.hot) == 4
+        assert queue.cold_count == 21
+        assert len(segment_files(tmpdir)) == 5
+
+        seen = []
+        most_segments = 0
+        for t in tasks[25:]:
+            # interleave adds with draining
+            queue.add(t)
+            with queue.get() as top:
+                seen.append(top.id)
+                top.mark_done()
+            most_segments = max(most_segments, len(segment_files(tmpdir)))
+        while len(queue):
+            with queue.get() as top:
+                seen.append(top.id)
+                top.mark_done()
+
+        assert seen == [t.id for t in tasks]
+        # paged in segments are deleted as the backlog moves through them
+        assert most_segments <= 6
+        assert segment_files(tmpdir) == []
+
+
+def test_tiered_queue_pages_in_a_batch_per_get():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        num_tasks = TieredQueue.PAGE_IN_TASKS * 3
+        task_size = CompactTask.from_task(make_task(1)).size()
+        queue = TieredQueue(tmpdir, max_memory_bytes=task_size)
+        for i in range(num_tasks):
+            queue.add(make_task(i))
+        assert queue.cold_count == num_tasks - 1
+
+        # room for every task, still one batch is paged in per get
+        queue.max_memory_bytes = task_size * num_tasks * 2
+        with queue.get() as top:
+            top.mark_done()
+        assert len(queue.hot) == TieredQueue.PAGE_IN_TASKS
+        assert queue.cold_count == num_tasks - 1 - TieredQueue.PAGE_IN_TASKS
+
+
+def test_tiered_queue_discards_segments_on_startup():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        task_size = CompactTask.from_task(make_task(1)).size()
+        queue = TieredQueue(tmpdir, max_memory_bytes=task_size, segment_tasks=2)
+        for i in range(10):
+            queue.add(make_task(i))
+        assert segment_files(tmpdir)
+
+        assert len(TieredQueue(tmpdir)) == 0
+        assert segment_files(tmpdir) == []